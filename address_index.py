@@ -0,0 +1,47 @@
+# In-process prefix index of addresses we already have coordinates for
+# (previous geocoder hits and the lost_location/found_location of saved reports),
+# used for as-you-type suggestions so picking one skips the remote geocoder.
+import bisect
+import threading
+
+
+def normalize(text):
+    return " ".join((text or "").strip().lower().split())
+
+
+class AddressIndex:
+    """Sorted array of normalized addresses; prefix lookups are two binary searches."""
+
+    def __init__(self):
+        self._keys = []       # sorted normalized keys
+        self._entries = {}    # key -> (display text, lat, lon)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, text, lat, lon):
+        key = normalize(text)
+        if not key or lat is None or lon is None:
+            return
+        with self._lock:
+            if key not in self._entries:
+                bisect.insort(self._keys, key)
+            self._entries[key] = (text.strip(), lat, lon)
+
+    def get(self, text):
+        """Coordinates for an exact (normalized) address, or None."""
+        with self._lock:
+            entry = self._entries.get(normalize(text))
+        return (entry[1], entry[2]) if entry else None
+
+    def suggest(self, prefix, limit=6):
+        """Up to `limit` (display, lat, lon) entries whose address starts with `prefix`."""
+        key = normalize(prefix)
+        if len(key) < 2:
+            return []
+        with self._lock:
+            start = bisect.bisect_left(self._keys, key)
+            # every key with this prefix sorts before key + U+FFFF
+            end = min(bisect.bisect_left(self._keys, key + "\uffff"), start + limit)
+            return [self._entries[k] for k in self._keys[start:end]]
@@ -0,0 +1,236 @@
+# Area alert subscriptions: users subscribe to a circle or polygon, and each new report is
+# matched against the subscriptions through an in-memory R-tree over their bounding boxes,
+# so only the few areas whose box contains the report's point are tested exactly.
+import json
+import threading
+
+from models import AreaSubscription, Notification, session_scope, add_report_listener
+from geo import bounding_box, haversine_km
+from species import normalize_species
+
+NODE_CAPACITY = 16
+REBUILD_AFTER = 64   # pending inserts/removals before the tree is repacked
+
+
+def _contains(box, lat, lon):
+    return box[0] <= lat <= box[1] and box[2] <= lon <= box[3]
+
+
+def _union(boxes):
+    return (min(b[0] for b in boxes), max(b[1] for b in boxes),
+            min(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def point_in_polygon(lat, lon, polygon):
+    """Ray casting; polygon is a list of [lat, lon] vertices."""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        yi, xi = polygon[i]
+        yj, xj = polygon[j]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class SubscriptionRTree:
+    """R-tree of subscription bounding boxes (min_lat, max_lat, min_lon, max_lon).
+
+    The tree is packed with Sort-Tile-Recursive; inserts between repacks go to a small
+    pending list that is scanned linearly, and removals are dropped from `_entries`.
+    """
+
+    def __init__(self):
+        self._entries = {}   # subscription id -> (box, subscription dict)
+        self._root = None    # (box, children, is_leaf); leaf children are subscription ids
+        self._pending = []
+        self._changes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _pack(self):
+        items = [(box, sid) for sid, (box, _) in self._entries.items()]
+        if not items:
+            self._root = None
+            return
+        level = self._str_level(items, leaf=True)
+        while len(level) > 1:
+            level = self._str_level([(node[0], node) for node in level], leaf=False)
+        self._root = level[0]
+
+    def _str_level(self, items, leaf):
+        # sort by longitude into vertical slices, then by latitude inside each slice
+        n_nodes = -(-len(items) // NODE_CAPACITY)
+        per_slice = NODE_CAPACITY * max(1, int(round(n_nodes ** 0.5)))
+        items.sort(key=lambda it: (it[0][2] + it[0][3]) / 2)
+        nodes = []
+        for s in range(0, len(items), per_slice):
+            chunk = sorted(items[s:s + per_slice], key=lambda it: (it[0][0] + it[0][1]) / 2)
+            for i in range(0, len(chunk), NODE_CAPACITY):
+                group = chunk[i:i + NODE_CAPACITY]
+                nodes.append((_union([g[0] for g in group]), [g[1] for g in group], leaf))
+        return nodes
+
+    def insert(self, sub):
+        box = (sub["min_lat"], sub["max_lat"], sub["min_lon"], sub["max_lon"])
+        with self._lock:
+            self._entries[sub["id"]] = (box, sub)
+            self._pending.append(sub["id"])
+            self._after_change()
+
+    def remove(self, sub_id):
+        with self._lock:
+            if self._entries.pop(sub_id, None) is not None:
+                self._after_change()
+
+    def _after_change(self):
+        self._changes += 1
+        if self._changes >= REBUILD_AFTER:
+            self._pack()
+            self._pending = []
+            self._changes = 0
+
+    def rebuild(self, subs):
+        with self._lock:
+            self._entries = {s["id"]: ((s["min_lat"], s["max_lat"], s["min_lon"], s["max_lon"]), s) for s in subs}
+            self._pack()
+            self._pending = []
+            self._changes = 0
+
+    def query_point(self, lat, lon):
+        """Subscriptions whose bounding box contains the point."""
+        found = set()
+        with self._lock:
+            stack = [self._root] if self._root is not None else []
+            while stack:
+                box, children, leaf = stack.pop()
+                if not _contains(box, lat, lon):
+                    continue
+                if leaf:
+                    found.update(children)
+                else:
+                    stack.extend(children)
+            found.update(self._pending)
+            return [self._entries[sid][1] for sid in found
+                    if sid in self._entries and _contains(self._entries[sid][0], lat, lon)]
+
+
+def _sub_dict(sub):
+    return {
+        "id": sub.id, "user_id": sub.user_id, "label": sub.label,
+        "center_lat": sub.center_lat, "center_lon": sub.center_lon, "radius_km": sub.radius_km,
+        "polygon": json.loads(sub.polygon) if sub.polygon else None,
+        "species": sub.species, "report_kind": sub.report_kind,
+        "min_lat": sub.min_lat, "max_lat": sub.max_lat, "min_lon": sub.min_lon, "max_lon": sub.max_lon,
+    }
+
+
+_tree = None
+_tree_lock = threading.Lock()
+
+
+def get_subscription_index():
+    global _tree
+    if _tree is None:
+        with _tree_lock:
+            if _tree is None:
+                tree = SubscriptionRTree()
+                with session_scope() as s:
+                    tree.rebuild([_sub_dict(sub) for sub in s.query(AreaSubscription)])
+                _tree = tree
+    return _tree
+
+
+def create_subscription(user_id, label=None, center=None, radius_km=None, polygon=None,
+                        species=None, report_kind=None):
+    """Circle (center=(lat, lon) + radius_km) or polygon ([(lat, lon), ...]) subscription."""
+    if polygon:
+        if len(polygon) < 3:
+            raise ValueError("a polygon needs at least 3 points")
+        lats = [p[0] for p in polygon]
+        lons = [p[1] for p in polygon]
+        box = (min(lats), max(lats), min(lons), max(lons))
+    elif center is not None and radius_km:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(center[0], center[1], radius_km)
+        if min_lon is None:
+            min_lon, max_lon = -180.0, 180.0
+        box = (min_lat, max_lat, min_lon, max_lon)
+    else:
+        raise ValueError("a subscription needs a center and radius or a polygon")
+    with session_scope() as s:
+        sub = AreaSubscription(
+            user_id=user_id, label=label,
+            center_lat=center[0] if center else None, center_lon=center[1] if center else None,
+            radius_km=radius_km if not polygon else None,
+            polygon=json.dumps([list(p) for p in polygon]) if polygon else None,
+            species=species, report_kind=report_kind,
+            min_lat=box[0], max_lat=box[1], min_lon=box[2], max_lon=box[3])
+        s.add(sub)
+        s.flush()
+        data = _sub_dict(sub)
+    get_subscription_index().insert(data)
+    return data
+
+
+def delete_subscription(user_id, sub_id):
+    with session_scope() as s:
+        sub = s.get(AreaSubscription, sub_id)
+        if not sub or sub.user_id != user_id:
+            return False
+        s.delete(sub)
+    get_subscription_index().remove(sub_id)
+    return True
+
+
+def _species_matches(wanted, species):
+    if not wanted:
+        return True
+    key = normalize_species(wanted)
+    if key == "outro":   # not in the vocabulary: fall back to the typed text
+        return (species or "").strip().lower() == wanted.strip().lower()
+    return normalize_species(species) == key
+
+
+def matching_subscriptions(kind, lat, lon, species=None, author_id=None):
+    matches = []
+    for sub in get_subscription_index().query_point(lat, lon):
+        if sub["user_id"] == author_id:
+            continue
+        if sub["report_kind"] and sub["report_kind"] != kind:
+            continue
+        if not _species_matches(sub["species"], species):
+            continue
+        if sub["polygon"]:
+            if not point_in_polygon(lat, lon, sub["polygon"]):
+                continue
+        elif haversine_km(sub["center_lat"], sub["center_lon"], lat, lon) > sub["radius_km"]:
+            continue
+        matches.append(sub)
+    return matches
+
+
+def _on_report_change(kind, action, before, after):
+    if action != "insert" or after["latitude"] is None or after["longitude"] is None:
+        return
+    author_id = after.get("owner_id") if kind == "lost" else after.get("finder_id")
+    subs = matching_subscriptions(kind, after["latitude"], after["longitude"], after.get("species"), author_id)
+    if not subs:
+        return
+    if kind == "lost":
+        what = f"Animal perdido: {after.get('name') or ''}"
+        where = after.get("lost_location")
+    else:
+        what = f"Animal encontrado: {after.get('species') or 'espécie não informada'}"
+        where = after.get("found_location")
+    with session_scope() as s:
+        for sub in subs:
+            s.add(Notification(
+                user_id=sub["user_id"], subscription_id=sub["id"],
+                report_kind=kind, report_id=after["id"],
+                message=f"{what} ({where or 'local não informado'}) — área '{sub['label'] or 'sem nome'}'"))
+
+
+add_report_listener(_on_report_change)
@@ -1,61 +1,131 @@
 # (full file contents)
-import flet as ft
+from profiling import profiled, timed_phase, startup_report
+
+with timed_phase("import flet"):
+    import flet as ft
+import asyncio
 import os
 import threading
 import socket
 import json
 import webbrowser
 import time
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+import secrets
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 from functools import partial
+from urllib.parse import urlsplit, parse_qs
 from pathlib import Path
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
 
-from models import User, LostAnimal, FoundReport, session_scope, session
+with timed_phase("import models (sqlalchemy)"):
+    from models import (User, LostAnimal, FoundReport, AreaSubscription, Notification, session_scope, session,
+                        reported_since, open_only, REPORT_STATUSES)
+# app modules come after models so the phase above measures the SQLAlchemy/models import
+with timed_phase("import app modules"):
+    from dates import parse_free_date
+    from address_index import AddressIndex
+    from nearby import find_nearby
+    from dedup import find_duplicates
+    from photos import store_photo, photo_file, is_photo_hash, sniff_content_type, THUMB_SIZES, UPLOAD_DIR
+    from photo_similarity import similar_reports
+    from alerts import create_subscription, delete_subscription
+    from archive import search_archive, start_archiver
+    from facets import species_facets
+    from geocoding import get_geocoder, GeocodingUnavailable, SingleFlight, NearbyCache
+    import async_repository as repo
+
+# SIARA_FAST_START=1 defers the map server and map.html generation until the map is first needed
+FAST_START = os.environ.get("SIARA_FAST_START") == "1"
+
+STATUS_LABELS = {"open": "Em aberto", "reunited": "Reencontrado", "adopted": "Adotado", "closed": "Encerrado"}
 
 # ---- Geocoding setup ----
-geolocator = Nominatim(user_agent="siara_app_geocoder")
-geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1, return_value_on_exception=None)
-reverse_rate_limited = RateLimiter(geolocator.reverse, min_delay_seconds=1, return_value_on_exception=None)
+# lookups go through the provider chain in geocoding.py (local server, gazetteer, Nominatim);
+# geopy and the HTTP clients are only imported/built on the first lookup
 
-# small in-memory caches
+# small in-memory caches, shared by every session; the lock guards reads/writes from
+# concurrent Flet sessions (the network call itself happens outside the lock).
+# Identical lookups that arrive while one is in flight wait for it instead of queueing
+# their own request, and reverse results are reused for points within a few metres.
 _geocode_cache = {}
-_reverse_cache = {}
+_reverse_cache = NearbyCache()
+_cache_lock = threading.Lock()
+_geocode_flight = SingleFlight()
+_reverse_flight = SingleFlight()
+
+# addresses with known coordinates, for autocomplete and to skip remote lookups;
+# built from the database on first use and grown as new addresses are resolved
+_address_index = None
+_address_index_lock = threading.Lock()
+
+def get_address_index():
+    global _address_index
+    if _address_index is None:
+        with _address_index_lock:
+            if _address_index is None:
+                index = AddressIndex()
+                with session_scope() as s:
+                    rows = s.query(LostAnimal.lost_location, LostAnimal.latitude, LostAnimal.longitude).filter(
+                        LostAnimal.lost_location.isnot(None), LostAnimal.latitude.isnot(None), LostAnimal.longitude.isnot(None)).all()
+                    rows += s.query(FoundReport.found_location, FoundReport.latitude, FoundReport.longitude).filter(
+                        FoundReport.found_location.isnot(None), FoundReport.latitude.isnot(None), FoundReport.longitude.isnot(None)).all()
+                for text, lat, lon in rows:
+                    index.add(text, lat, lon)
+                with _cache_lock:
+                    for text, (lat, lon) in _geocode_cache.items():
+                        index.add(text, lat, lon)
+                _address_index = index
+    return _address_index
 
 def geocode_address(text):
     if not text:
         return None, None
+    known = get_address_index().get(text)
+    if known:
+        return known
     key = text.strip().lower()
-    if key in _geocode_cache:
-        return _geocode_cache[key]
-    try:
-        loc = geocode(text, timeout=10)
-        if loc:
-            coords = (loc.latitude, loc.longitude)
+    with _cache_lock:
+        if key in _geocode_cache:
+            return _geocode_cache[key]
+
+    def lookup():
+        with _cache_lock:   # a previous flight may have finished since the check above
+            if key in _geocode_cache:
+                return _geocode_cache[key]
+        coords = get_geocoder().geocode(text) or (None, None)
+        with _cache_lock:
             _geocode_cache[key] = coords
-            return coords
-    except Exception as e:
-        print("Geocode error:", e)
-    _geocode_cache[key] = (None, None)
-    return None, None
+        if coords[0] is not None:
+            get_address_index().add(text, *coords)
+        return coords
+
+    try:
+        return _geocode_flight.do(key, lookup)
+    except GeocodingUnavailable as e:
+        # transient: not cached, the next lookup tries the providers again
+        print("Geocode unavailable:", e)
+        return None, None
 
 def reverse_geocode(lat, lon):
     if lat is None or lon is None:
         return None
-    key = f"{lat:.6f},{lon:.6f}"
-    if key in _reverse_cache:
-        return _reverse_cache[key]
-    try:
-        loc = reverse_rate_limited(f"{lat}, {lon}", exactly_one=True, timeout=10)
-        if loc and getattr(loc, "address", None):
-            address = loc.address
-            _reverse_cache[key] = address
+    hit, address = _reverse_cache.get(lat, lon)
+    if hit:
+        return address
+
+    def lookup():
+        hit, address = _reverse_cache.get(lat, lon)
+        if hit:
             return address
-    except Exception as e:
-        print("Reverse geocode error:", e)
-    _reverse_cache[key] = None
-    return None
+        address = get_geocoder().reverse(lat, lon)
+        _reverse_cache.put(lat, lon, address)
+        return address
+
+    # points that round to the same ~10 m square share one in-flight request
+    try:
+        return _reverse_flight.do(f"{lat:.4f},{lon:.4f}", lookup)
+    except GeocodingUnavailable as e:
+        print("Reverse geocode unavailable:", e)
+        return None
 
 # ---- Static map preview helper (OpenStreetMap static map service) ----
 def build_static_map_url(lat, lon, zoom=15, width=600, height=300, marker="red-pushpin"):
@@ -66,14 +136,298 @@ def build_static_map_url(lat, lon, zoom=15, width=600, height=300, marker="red-p
     print("Preview URL:", url)
     return url
 
+# ---- Shared map preview component (used by the register/edit forms) ----
+class MapPreview:
+    """Static map image + reverse-geocoded address for a pair of lat/lon fields.
+
+    Edits to the fields are debounced, lookups run off the UI thread, and a newer
+    refresh supersedes any lookup still in flight (its result is discarded).
+    """
+    DEBOUNCE_SECONDS = 0.6
+    PLACEHOLDER = "Buscando endereço..."
+
+    def __init__(self, page, lat_field, lon_field, not_found_text="Endereço não encontrado"):
+        self.page = page
+        self.lat_field = lat_field
+        self.lon_field = lon_field
+        self.not_found_text = not_found_text
+        self.image = ft.Image(src="", width=600, height=300)
+        self.address = ft.Text("", selectable=True)
+        self._generation = 0
+        self._timer = None
+        self._lock = threading.Lock()
+        lat_field.on_change = lambda e: self.schedule()
+        lon_field.on_change = lambda e: self.schedule()
+
+    def _read_coords(self):
+        try:
+            lat_s = (self.lat_field.value or "").strip()
+            lon_s = (self.lon_field.value or "").strip()
+            if lat_s and lon_s:
+                return float(lat_s), float(lon_s)
+        except ValueError:
+            pass
+        return None
+
+    def schedule(self, delay=None):
+        """Show the placeholder now and look the coordinates up once typing settles."""
+        coords = self._read_coords()
+        # the lat and lon handlers may run at once on Flet's thread pool: the timer is
+        # replaced and started under the lock so only the newest one ever runs
+        with self._lock:
+            self._generation += 1
+            gen = self._generation
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if coords:
+                timer = threading.Timer(self.DEBOUNCE_SECONDS if delay is None else delay,
+                                        self.update_preview, args=(gen,))
+                timer.daemon = True
+                self._timer = timer
+                timer.start()
+        self.address.value = self.PLACEHOLDER if coords else ""
+        if not coords:
+            self.image.src = ""
+        try:
+            self.address.update()
+            self.image.update()
+        except Exception:
+            pass   # not on the page yet
+
+    def refresh(self):
+        """Refresh right away (buttons, picked coords, cleared forms)."""
+        self.schedule(delay=0)
+
+    def _is_current(self, gen):
+        with self._lock:
+            return gen == self._generation
+
+    @profiled
+    def update_preview(self, gen):
+        coords = self._read_coords()
+        if coords is None or not self._is_current(gen):
+            return
+        lat, lon = coords
+        src = build_static_map_url(lat, lon)
+        address = reverse_geocode(lat, lon)
+        if not self._is_current(gen):
+            return   # superseded while the lookup was running
+        self.image.src = src
+        self.address.value = address or self.not_found_text
+        try:
+            self.page.update()
+        except Exception:
+            pass
+
+class AddressAutocomplete:
+    """As-you-type suggestions under a location field, from the local address index.
+
+    Picking a suggestion fills the location and its known coordinates, so saving the
+    form needs no remote geocode call.
+    """
+    MAX_SUGGESTIONS = 6
+
+    def __init__(self, page, location_field, lat_field, lon_field, preview=None):
+        self.page = page
+        self.location_field = location_field
+        self.lat_field = lat_field
+        self.lon_field = lon_field
+        self.preview = preview
+        self.suggestions = ft.Column(spacing=0)
+        location_field.on_change = self.on_location_change
+
+    @profiled
+    def on_location_change(self, e=None):
+        matches = get_address_index().suggest(self.location_field.value, limit=self.MAX_SUGGESTIONS)
+        # nothing to suggest once the text is exactly a known address
+        if len(matches) == 1 and matches[0][0].lower() == (self.location_field.value or "").strip().lower():
+            matches = []
+        self.suggestions.controls = [
+            ft.ListTile(title=ft.Text(text), subtitle=ft.Text(f"{lat:.6f}, {lon:.6f}"), dense=True,
+                        on_click=lambda e, t=text, la=lat, lo=lon: self.pick(t, la, lo))
+            for text, lat, lon in matches
+        ]
+        try:
+            self.suggestions.update()
+        except Exception:
+            pass
+
+    def pick(self, text, lat, lon):
+        self.location_field.value = text
+        self.lat_field.value = f"{lat:.6f}"
+        self.lon_field.value = f"{lon:.6f}"
+        self.suggestions.controls = []
+        self.page.update()
+        if self.preview is not None:
+            self.preview.refresh()
+
+class PhotoPicker:
+    """'Foto' button + thumbnail for a report form. Picked files are stored by content
+    hash right away; thumbnails are rendered by the photos worker pool."""
+
+    def __init__(self, page, photo_hash=None):
+        self.page = page
+        self.photo_hash = photo_hash
+        # one picker per screen: drop the pickers left over from previous screens
+        page.overlay[:] = [c for c in page.overlay if not isinstance(c, ft.FilePicker)]
+        self.picker = ft.FilePicker(on_result=self.on_result, on_upload=self.on_upload)
+        page.overlay.append(self.picker)
+        self.thumb = ft.Image(src=photo_url(photo_hash) if photo_hash else "", width=96, height=96,
+                              fit=ft.ImageFit.COVER, visible=bool(photo_hash))
+        self.status = ft.Text("")
+        self.row = ft.Row([
+            ft.ElevatedButton("Foto", on_click=lambda e: self.picker.pick_files(
+                allow_multiple=False, file_type=ft.FilePickerFileType.IMAGE)),
+            ft.TextButton("Remover foto", on_click=lambda e: self.clear()),
+            self.thumb, self.status])
+        self._upload_name = None
+
+    @profiled
+    def on_result(self, e):
+        if not e.files:
+            return
+        f = e.files[0]
+        if f.path:
+            self._store(Path(f.path))
+        else:
+            # web mode: the browser uploads the file to UPLOAD_DIR first
+            UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+            self._upload_name = f"{secrets.token_hex(8)}-{Path(f.name).name}"
+            self.status.value = "Enviando foto..."
+            self.page.update()
+            self.picker.upload([ft.FilePickerUploadFile(f.name, upload_url=self.page.get_upload_url(self._upload_name, 600))])
+
+    @profiled
+    def on_upload(self, e):
+        if e.error:
+            self.status.value = "Falha ao enviar a foto"
+            self.page.update()
+        elif e.progress == 1 and self._upload_name:
+            path = UPLOAD_DIR / self._upload_name
+            self._upload_name = None
+            self._store(path)
+            path.unlink(missing_ok=True)
+
+    def _store(self, path):
+        try:
+            self.photo_hash = store_photo(path.read_bytes())
+        except (OSError, ValueError) as ex:
+            print("Photo error:", ex)
+            self.status.value = "Arquivo de imagem inválido"
+            self.page.update()
+            return
+        self.thumb.src = photo_url(self.photo_hash)
+        self.thumb.visible = True
+        self.status.value = ""
+        self.page.update()
+
+    def clear(self):
+        self.photo_hash = None
+        self.thumb.src = ""
+        self.thumb.visible = False
+        self.status.value = ""
+        try:
+            self.page.update()
+        except Exception:
+            pass
+
+class RenderedItems:
+    """Per-session cache of list item controls keyed by report id. A control is reused as long
+    as the row's version is unchanged, so going back to a list only rebuilds added/edited rows."""
+
+    LOAD_CHUNK = 500   # ids per IN (...) query, below SQLite's bound-parameter limit
+
+    @staticmethod
+    def row_versions(rows):
+        """(id, version, reported_at) rows -> (id, (version, reported_at)). SQLite may give a
+        deleted row's id to a new row, which starts at version 1 again; the posting time
+        tells the two apart."""
+        return [(rid, (version, reported_at)) for rid, version, reported_at in rows]
+
+    def __init__(self):
+        self._items = {}   # report id -> (version, control)
+
+    def controls(self, versions, load, build):
+        """versions: [(id, key), ...] in display order, key being the (version, reported_at)
+        pair from row_versions(). load(ids) returns {id: row} for the
+        rows that need a new control and build(row) makes it. Rows missing from `versions`
+        (deleted or filtered out) are dropped from the cache."""
+        wanted = dict(versions)
+        stale = [rid for rid, ver in versions if self._items.get(rid, (None,))[0] != ver]
+        for i in range(0, len(stale), self.LOAD_CHUNK):
+            chunk = stale[i:i + self.LOAD_CHUNK]
+            rows = load(chunk)
+            for rid in chunk:
+                if rid in rows:
+                    self._items[rid] = (wanted[rid], build(rows[rid]))
+                else:
+                    self._items.pop(rid, None)   # deleted since the version query
+        self._items = {rid: self._items[rid] for rid, _ in versions if rid in self._items}
+        return [self._items[rid][1] for rid, _ in versions if rid in self._items]
+
 # ---- Map server globals and utilities ----
 STATIC_DIR = Path(os.getcwd()) / "map_static"
-STATIC_DIR.mkdir(exist_ok=True)
 
-LAST_PICK = {"lat": None, "lon": None}   # updated by POST /pick
+# Bind address/port of the map server and the base URL browsers use to reach it.
+# Web deployments set these so remote users can open the map (port 0 = pick a free one).
+MAP_HOST = os.environ.get("SIARA_MAP_HOST", "127.0.0.1")
+MAP_PORT = int(os.environ.get("SIARA_MAP_PORT", "0"))
+MAP_PUBLIC_URL = os.environ.get("SIARA_MAP_PUBLIC_URL", "").rstrip("/")
+
+# per-session picks: each Flet session gets a token that is embedded in its map URL,
+# so a click on one user's map never overwrites another user's pick.
+# A connected session keeps its token however long it stays idle; a disconnected one
+# keeps it for PICK_TTL_SECONDS in case the browser reconnects, then it is forgotten.
+PICK_TTL_SECONDS = 3600
+_picks = {}   # token -> {"lat", "lon", "disconnected_at"} (lat/lon None until the first click)
+_picks_lock = threading.Lock()
+
+def _purge_disconnected(now):
+    for t in [t for t, p in _picks.items()
+              if p["disconnected_at"] is not None and now - p["disconnected_at"] > PICK_TTL_SECONDS]:
+        del _picks[t]
+
+def register_session():
+    token = secrets.token_urlsafe(16)
+    with _picks_lock:
+        _purge_disconnected(time.time())
+        _picks[token] = {"lat": None, "lon": None, "disconnected_at": None}
+    return token
+
+def session_connected(token):
+    with _picks_lock:
+        p = _picks.setdefault(token, {"lat": None, "lon": None, "disconnected_at": None})
+        p["disconnected_at"] = None
+
+def session_disconnected(token):
+    with _picks_lock:
+        if token in _picks:
+            _picks[token]["disconnected_at"] = time.time()
+
+def drop_session(token):
+    with _picks_lock:
+        _picks.pop(token, None)
+
+def set_pick(token, lat, lon):
+    with _picks_lock:
+        p = _picks.get(token)
+        if p is None:
+            return False
+        p["lat"], p["lon"] = lat, lon
+        return True
+
+def get_pick(token):
+    with _picks_lock:
+        p = _picks.get(token)
+        if p is None:
+            return None, None
+        return p["lat"], p["lon"]
 
 _httpd = None
 _httpd_thread = None
+_map_port = None
+_map_lock = threading.Lock()
 
 def find_free_port():
     s = socket.socket()
@@ -83,33 +437,148 @@ def find_free_port():
     return port
 
 class MapHandler(SimpleHTTPRequestHandler):
+    def send_json(self, obj):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_photo(self):
+        # /photos/<hash> (original) or /photos/<size>/<hash> (thumbnail)
+        parts = urlsplit(self.path).path.strip("/").split("/")[1:]
+        size = parts[0] if len(parts) == 2 else None
+        content_hash = parts[-1] if parts else ""
+        if not is_photo_hash(content_hash) or len(parts) > 2 or (size is not None and size not in THUMB_SIZES):
+            self.send_error(404)
+            return
+        etag = f'"{content_hash}-{size or "orig"}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        path = photo_file(content_hash, size)
+        if path is None:
+            self.send_error(404)
+            return
+        data = path.read_bytes()
+        total = len(data)
+        start, end = 0, total - 1
+        status = 200
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes=") and "," not in range_header:
+            first, _, last = range_header[6:].strip().partition("-")
+            try:
+                if first:
+                    start = int(first)
+                    end = min(int(last), total - 1) if last else total - 1
+                else:
+                    start = max(0, total - int(last))   # suffix range: last N bytes
+            except ValueError:
+                start, end = 0, total - 1
+            else:
+                if start > end or start >= total:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{total}")
+                    self.end_headers()
+                    return
+                status = 206
+        body = data[start:end + 1]
+        self.send_response(status)
+        self.send_header("Content-Type", sniff_content_type(data[:16]) or "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        # content-addressed: a URL never changes content, so browsers may cache it forever
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.send_header("ETag", etag)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        if self.path.startswith("/photos/"):
+            try:
+                self.send_photo()
+            except Exception as e:
+                print("Photo error:", e)
+                self.send_error(500)
+            return
+        return super().do_HEAD()
+
     def do_GET(self):
-        if self.path.startswith("/reports.json"):
+        if self.path.startswith("/photos/"):
+            try:
+                self.send_photo()
+            except Exception as e:
+                print("Photo error:", e)
+                self.send_error(500)
+            return
+        elif self.path.startswith("/heatmap.json"):
+            try:
+                query = parse_qs(urlsplit(self.path).query)
+                zoom = int(query.get("zoom", ["2"])[0])
+                bbox = None
+                if query.get("bbox"):
+                    west, south, east, north = (float(v) for v in query["bbox"][0].split(","))
+                    bbox = (west, south, east, north)
+                from heatmap import heatmap_cache   # numpy is only loaded when the heat layer is used
+                self.send_json({"zoom": zoom, "cells": heatmap_cache.cells(zoom, bbox)})
+            except ValueError as e:
+                self.send_response(400)
+                self.end_headers()
+                self.wfile.write(str(e).encode("utf-8"))
+            except Exception as e:
+                self.send_response(500)
+                self.end_headers()
+                self.wfile.write(str(e).encode("utf-8"))
+            return
+        elif self.path.startswith("/species.json"):
+            try:
+                self.send_json([{"species": key, "label": label, "count": total}
+                                for key, label, total in species_facets.chips()])
+            except Exception as e:
+                self.send_response(500)
+                self.end_headers()
+                self.wfile.write(str(e).encode("utf-8"))
+            return
+        elif self.path.startswith("/reports.json"):
             try:
+                query = parse_qs(urlsplit(self.path).query)
+                days = int(query["days"][0]) if query.get("days") else None
+                species = query["species"][0] if query.get("species") else None
                 reports = []
                 with session_scope() as s:
-                    for a in s.query(LostAnimal).all():
+                    losts = s.query(LostAnimal).filter(open_only(LostAnimal))
+                    founds = s.query(FoundReport).filter(open_only(FoundReport))
+                    if days:
+                        losts = losts.filter(reported_since(LostAnimal, days))
+                        founds = founds.filter(reported_since(FoundReport, days))
+                    if species:
+                        losts = losts.filter(LostAnimal.species_norm == species)
+                        founds = founds.filter(FoundReport.species_norm == species)
+                    for a in losts:
                         reports.append({
                             "type": "Animal perdido",
                             "title": a.name,
                             "desc": f"{a.desc_animal or ''} ({a.lost_location or ''})",
                             "lat": a.latitude,
-                            "lon": a.longitude
+                            "lon": a.longitude,
+                            "thumb": f"/photos/md/{a.photo_hash}" if a.photo_hash else None
                         })
-                    for r in s.query(FoundReport).all():
+                    for r in founds:
                         reports.append({
                             "type": "found",
                             "title": r.species or "Animal encontrado",
                             "desc": f"{r.found_description or ''} ({r.found_location or ''})",
                             "lat": r.latitude,
-                            "lon": r.longitude
+                            "lon": r.longitude,
+                            "thumb": f"/photos/md/{r.photo_hash}" if r.photo_hash else None
                         })
-                data = json.dumps(reports).encode("utf-8")
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.send_header("Content-Length", str(len(data)))
-                self.end_headers()
-                self.wfile.write(data)
+                self.send_json(reports)
             except Exception as e:
                 self.send_response(500)
                 self.end_headers()
@@ -119,7 +588,6 @@ class MapHandler(SimpleHTTPRequestHandler):
             return super().do_GET()
 
     def do_POST(self):
-        global LAST_PICK
         if self.path == "/pick":
             length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(length)
@@ -127,9 +595,12 @@ class MapHandler(SimpleHTTPRequestHandler):
                 payload = json.loads(body.decode('utf-8'))
                 lat = payload.get("lat")
                 lon = payload.get("lon")
+                token = payload.get("session")
                 if lat is not None and lon is not None:
-                    LAST_PICK["lat"] = float(lat)
-                    LAST_PICK["lon"] = float(lon)
+                    if not token:
+                        raise ValueError("session token missing")
+                    if not set_pick(token, float(lat), float(lon)):
+                        raise ValueError("unknown session, reopen the map from the app")
                     self.send_response(200)
                     self.end_headers()
                     self.wfile.write(b"OK")
@@ -151,7 +622,9 @@ def start_map_server(port):
     if _httpd is not None:
         return
     handler_class = partial(MapHandler, directory=str(STATIC_DIR))
-    _httpd = HTTPServer(("127.0.0.1", port), handler_class)
+    # one thread per request, so many sessions can load the map at the same time
+    _httpd = ThreadingHTTPServer((MAP_HOST, port), handler_class)
+    _httpd.daemon_threads = True
     def serve():
         try:
             _httpd.serve_forever()
@@ -159,13 +632,14 @@ def start_map_server(port):
             print("Map server stopped:", e)
     _httpd_thread = threading.Thread(target=serve, daemon=True)
     _httpd_thread.start()
-    print(f"Map server started at http://127.0.0.1:{port}/")
+    print(f"Map server started at http://{MAP_HOST}:{port}/")
 
 def stop_map_server():
-    global _httpd
+    global _httpd, _map_port
     if _httpd:
         _httpd.shutdown()
         _httpd = None
+        _map_port = None
 
 MAP_HTML = """<!doctype html>
 <html>
@@ -173,15 +647,20 @@ MAP_HTML = """<!doctype html>
 <meta charset="utf-8" />
 <meta name="viewport" content="width=device-width, initial-scale=1.0">
 <link rel="stylesheet" href="https://unpkg.com/leaflet/dist/leaflet.css" />
-<style>html,body,#map{height:100%;margin:0;padding:0}</style>
+<style>html,body,#map{height:100%;margin:0;padding:0}
+.map-controls{background:#fff;padding:6px 8px;border-radius:4px;font:13px sans-serif;box-shadow:0 1px 4px rgba(0,0,0,.3)}</style>
 </head>
 <body>
 <div id="map"></div>
 <script src="https://unpkg.com/leaflet/dist/leaflet.js"></script>
+<script src="https://unpkg.com/leaflet.heat/dist/leaflet-heat.js"></script>
 <script>
-async function loadReports() {
+// session token of the Flet session that opened this map (see map_url_for_session)
+const SESSION = new URLSearchParams(window.location.search).get('session') || '';
+
+async function loadReports(query) {
     try {
-        const res = await fetch('/reports.json');
+        const res = await fetch('/reports.json' + (query || ''));
         return await res.json();
     } catch (e) {
         console.error('Failed to load reports', e);
@@ -197,31 +676,27 @@ function buildMap(reports) {
     }).addTo(map);
 
     var group = L.featureGroup();
-    reports.forEach(r=>{
-        if (!r.lat || !r.lon) return;
-        var color = (r.type === 'lost') ? 'red' : 'green';
-        var marker = L.circleMarker([r.lat, r.lon], {
-            radius: 8,
-            color: color,
-            fillColor: color,
-            fillOpacity: 0.9
-        }).bindPopup(`<b>${r.title || ''}</b><br>${r.desc || ''}`);
-        group.addLayer(marker);
-    });
+    addMarkers(group, reports);
     group.addTo(map);
     if (group.getLayers().length > 0) {
         map.fitBounds(group.getBounds().pad(0.2));
     }
+    addFilterControl(map, group);
+    addHeatmapControl(map, group);
 
     map.on('click', async function(e) {
         const lat = e.latlng.lat, lon = e.latlng.lng;
-        const payload = {lat: lat, lon: lon};
+        const payload = {lat: lat, lon: lon, session: SESSION};
         try {
-            await fetch('/pick', {
+            const res = await fetch('/pick', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify(payload)
             });
+            if (!res.ok) {
+                alert('Failed to send picked coords: ' + await res.text());
+                return;
+            }
             alert(`Picked coords: ${lat.toFixed(6)}, ${lon.toFixed(6)}\\nReturn to the app and press "Fetch picked coords" to import them.`);
         } catch (err) {
             alert('Failed to send picked coords: ' + err);
@@ -229,6 +704,103 @@ function buildMap(reports) {
     });
 }
 
+function addMarkers(group, reports) {
+    group.clearLayers();
+    reports.forEach(r=>{
+        if (!r.lat || !r.lon) return;
+        var color = (r.type === 'lost') ? 'red' : 'green';
+        var marker = L.circleMarker([r.lat, r.lon], {
+            radius: 8,
+            color: color,
+            fillColor: color,
+            fillOpacity: 0.9
+        }).bindPopup(`${r.thumb ? `<img src="${r.thumb}" loading="lazy" style="max-width:160px;display:block">` : ''}<b>${r.title || ''}</b><br>${r.desc || ''}`);
+        group.addLayer(marker);
+    });
+}
+
+// report filters (time window, species), applied server-side by /reports.json
+function addFilterControl(map, markers) {
+    var control = L.control({position: 'topright'});
+    control.onAdd = function() {
+        var div = L.DomUtil.create('div', 'map-controls');
+        div.innerHTML = '<select id="filter-days"><option value="">Todos os casos</option>' +
+            '<option value="1">Últimas 24 horas</option><option value="7">Últimos 7 dias</option>' +
+            '<option value="30">Últimos 30 dias</option></select> ' +
+            '<select id="filter-species"><option value="">Todas as espécies</option></select>';
+        L.DomEvent.disableClickPropagation(div);
+        return div;
+    };
+    control.addTo(map);
+    var days = document.getElementById('filter-days');
+    var species = document.getElementById('filter-species');
+    fetch('/species.json').then(res => res.json()).then(facets => {
+        facets.forEach(f => {
+            var opt = document.createElement('option');
+            opt.value = f.species;
+            opt.textContent = `${f.label} (${f.count})`;
+            species.appendChild(opt);
+        });
+    }).catch(e => console.error('Failed to load species', e));
+    async function reload() {
+        var params = new URLSearchParams();
+        if (days.value) params.set('days', days.value);
+        if (species.value) params.set('species', species.value);
+        addMarkers(markers, await loadReports('?' + params.toString()));
+    }
+    days.addEventListener('change', reload);
+    species.addEventListener('change', reload);
+}
+
+// density layer from /heatmap.json, refetched for the visible area on every move/zoom
+function addHeatmapControl(map, markers) {
+    var heat = null;
+    var control = L.control({position: 'topright'});
+    control.onAdd = function() {
+        var div = L.DomUtil.create('div', 'map-controls');
+        div.innerHTML = '<label><input type="checkbox" id="heat-toggle"> Mapa de calor</label> ' +
+            '<select id="heat-kind"><option value="all">Todos</option>' +
+            '<option value="lost">Perdidos</option><option value="found">Encontrados</option></select>';
+        L.DomEvent.disableClickPropagation(div);
+        return div;
+    };
+    control.addTo(map);
+    var toggle = document.getElementById('heat-toggle');
+    var kind = document.getElementById('heat-kind');
+
+    async function refresh() {
+        if (!toggle.checked) return;
+        var b = map.getBounds();
+        var bbox = [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()].join(',');
+        try {
+            const res = await fetch(`/heatmap.json?zoom=${map.getZoom()}&bbox=${bbox}`);
+            const data = await res.json();
+            var points = data.cells.map(c => {
+                var n = kind.value === 'lost' ? c.lost : kind.value === 'found' ? c.found : c.lost + c.found;
+                return [c.lat, c.lon, n];
+            }).filter(p => p[2] > 0);
+            var max = Math.max(1, ...points.map(p => p[2]));
+            if (heat) map.removeLayer(heat);
+            heat = L.heatLayer(points, {radius: 25, blur: 15, max: max}).addTo(map);
+        } catch (e) {
+            console.error('Failed to load heatmap', e);
+        }
+    }
+
+    function update() {
+        if (toggle.checked) {
+            map.removeLayer(markers);
+            refresh();
+        } else {
+            if (heat) { map.removeLayer(heat); heat = null; }
+            markers.addTo(map);
+        }
+    }
+    toggle.addEventListener('change', update);
+    kind.addEventListener('change', refresh);
+    map.on('moveend', refresh);
+}
+
 (async function() {
     const reports = await loadReports();
     buildMap(reports);
@@ -239,9 +811,36 @@ function buildMap(reports) {
 """
 
 def write_base_map_html():
+    STATIC_DIR.mkdir(exist_ok=True)
     p = STATIC_DIR / "map.html"
+    # skip the write when the file is already current
+    if p.exists() and p.read_text(encoding="utf-8") == MAP_HTML:
+        return
     p.write_text(MAP_HTML, encoding="utf-8")
 
+def ensure_map_server():
+    """Write map.html and start the map server on first use; returns the server port."""
+    global _map_port
+    with _map_lock:
+        if _map_port is None:
+            with timed_phase("map server + map.html"):
+                write_base_map_html()
+                port = MAP_PORT or find_free_port()
+                start_map_server(port)
+                _map_port = port
+    return _map_port
+
+def photo_url(content_hash, size="sm"):
+    """URL of a stored photo (or one of its thumbnails) on the map server."""
+    port = ensure_map_server()
+    base = MAP_PUBLIC_URL or f"http://127.0.0.1:{port}"
+    return f"{base}/photos/{size}/{content_hash}" if size else f"{base}/photos/{content_hash}"
+
+def map_url_for_session(token):
+    port = ensure_map_server()
+    base = MAP_PUBLIC_URL or f"http://127.0.0.1:{port}"
+    return f"{base}/map.html?session={token}"
+
 # ---- Flet UI ----
 def main(page: ft.Page):
     page.title = "SIARA"
@@ -249,13 +848,16 @@ def main(page: ft.Page):
     page.window_height = 700
     page.padding = 20
 
-    state = {"current_user": None, "map_port": None}
+    state = {"current_user": None, "session_token": register_session(),
+             # rendered list rows reused across screen changes, see RenderedItems
+             "list_items": {name: RenderedItems() for name in ("home_lost", "home_found", "my_lost", "my_found")}}
+    page.on_connect = lambda e: session_connected(state["session_token"])
+    page.on_disconnect = lambda e: session_disconnected(state["session_token"])
+    page.on_close = lambda e: drop_session(state["session_token"])
 
-    write_base_map_html()
-    if state.get("map_port") is None:
-        port = find_free_port()
-        state["map_port"] = port
-        start_map_server(port)
+    if not FAST_START:
+        ensure_map_server()
+    start_archiver()
 
     # helper: user feedback snackbar
     def show_snack(message: str, success: bool = True):
@@ -264,12 +866,14 @@ def main(page: ft.Page):
         page.snack_bar.open = True
         page.update()
 
+    @profiled
     def show_login(e=None):
         page.controls.clear()
         username = ft.TextField(label="Usuário")
         password = ft.TextField(label="Senha", password=True, can_reveal_password=True)
         msg = ft.Text("", color=ft.Colors.RED)
 
+        @profiled
         def do_login(ev):
             uname = username.value.strip()
             pwd = password.value or ""
@@ -290,6 +894,7 @@ def main(page: ft.Page):
                  ft.Row([ft.ElevatedButton("Log-in", on_click=do_login),
                          ft.TextButton("Não tenho uma conta", on_click=show_register)]), msg)
 
+    @profiled
     def show_register(e=None):
         page.controls.clear()
         username = ft.TextField(label="Usuário")
@@ -298,6 +903,7 @@ def main(page: ft.Page):
         password2 = ft.TextField(label="Confirmar senha", password=True, can_reveal_password=True)
         msg = ft.Text("", color=ft.Colors.RED)
 
+        @profiled
         def do_register(ev):
             uname = username.value.strip()
             pwd = password.value or ""
@@ -324,6 +930,7 @@ def main(page: ft.Page):
             show_snack("Account created; you are now logged in.")
             show_home()
 
+    @profiled
     def show_home(e=None):
         page.controls.clear()
         cur = state["current_user"]
@@ -335,32 +942,100 @@ def main(page: ft.Page):
         btn_found = ft.ElevatedButton("Registrar animal encontrado", on_click=show_found_registration)
         btn_my = ft.ElevatedButton("Meus posts", on_click=show_my_posts)
         btn_map = ft.ElevatedButton("Abrir mapa (browser)", on_click=show_map)
+        btn_nearby = ft.ElevatedButton("Casos próximos", on_click=show_nearby)
+        btn_history = ft.ElevatedButton("Histórico", on_click=show_history)
+        with session_scope() as s:
+            unread = s.query(Notification).filter_by(user_id=cur["id"], read=False).count()
+        btn_alerts = ft.ElevatedButton(f"Alertas ({unread})" if unread else "Alertas", on_click=show_alerts)
         btn_logout = ft.TextButton("Sair", on_click=do_logout)
 
+        period = ft.Dropdown(label="Período", width=200, value=state.get("home_days", "all"), options=[
+            ft.dropdown.Option("all", "Todos"),
+            ft.dropdown.Option("1", "Últimas 24 horas"),
+            ft.dropdown.Option("7", "Últimos 7 dias"),
+            ft.dropdown.Option("30", "Últimos 30 dias")])
+
+        @profiled
+        def on_period_change(ev):
+            state["home_days"] = period.value
+            show_home()
+        period.on_change = on_period_change
+
+        # species chips with live open-case counts (facets.species_facets)
+        species = state.get("home_species")
+
+        @profiled
+        def on_species_select(ev, key):
+            state["home_species"] = key if ev.control.selected else None
+            show_home()
+        chips = ft.Row(wrap=True, spacing=6, controls=[
+            ft.Chip(label=ft.Text(f"{label} ({total})"), selected=key == species,
+                    on_select=lambda ev, key=key: on_species_select(ev, key))
+            for key, label, total in species_facets.chips()])
+
         lost_list = ft.ListView(expand=True, spacing=10)
         found_list = ft.ListView(expand=True, spacing=10)
 
+        days = None if period.value == "all" else int(period.value)
         with session_scope() as s:
-            for a in s.query(LostAnimal).order_by(LostAnimal.id.desc()).all():
-                owner_name = a.owner.username if a.owner else "—"
-                info = f"Tutor: {owner_name}\nOnde foi perdido: {a.lost_location or ''}\nDescrição: {a.desc_animal or ''}"
-                if a.latitude and a.longitude:
-                    info += f"\nCoordenadas: {a.latitude:.6f}, {a.longitude:.6f}"
-                lost_list.controls.append(ft.Container(ft.ListTile(title=ft.Text(a.name), subtitle=ft.Text(info)), bgcolor=ft.Colors.BLACK12, padding=12, margin=3, border_radius=8))
-            for r in s.query(FoundReport).order_by(FoundReport.id.desc()).all():
-                finder_name = r.finder.username if r.finder else "—"
-                info = f"Quem encontrou: {finder_name}\nOnde foi encontrado: {r.found_location or ''}\nDescrição: {r.found_description or ''}"
-                if r.latitude and r.longitude:
-                    info += f"\nCoordenadas: {r.latitude:.6f}, {r.longitude:.6f}"
-                found_list.controls.append(ft.Container(ft.ListTile(title=ft.Text(r.species or "Animal encontrado"), subtitle=ft.Text(info)), bgcolor=ft.Colors.INDIGO_ACCENT, padding=12, margin=3, border_radius=8))
-
-        page.add(header, ft.Row([btn_lost, btn_found, btn_my, btn_map, btn_logout]), ft.Text("Animais perdidos:"), lost_list, ft.Text("Animais encontrados:"), found_list)
-
+            losts = s.query(LostAnimal.id, LostAnimal.version, LostAnimal.reported_at).filter(open_only(LostAnimal))
+            founds = s.query(FoundReport.id, FoundReport.version, FoundReport.reported_at).filter(open_only(FoundReport))
+            if days:
+                losts = losts.filter(reported_since(LostAnimal, days))
+                founds = founds.filter(reported_since(FoundReport, days))
+            if species:
+                losts = losts.filter(LostAnimal.species_norm == species)
+                founds = founds.filter(FoundReport.species_norm == species)
+            lost_versions = RenderedItems.row_versions(losts.order_by(LostAnimal.id.desc()).all())
+            found_versions = RenderedItems.row_versions(founds.order_by(FoundReport.id.desc()).all())
+
+        # only rows added/edited since the last visit are loaded and rebuilt
+        def load_losts(ids):
+            with session_scope() as s:
+                return {a.id: {"name": a.name, "owner": a.owner.username if a.owner else "—",
+                               "lost_location": a.lost_location, "desc_animal": a.desc_animal,
+                               "event_date": a.event_date, "latitude": a.latitude, "longitude": a.longitude,
+                               "photo_hash": a.photo_hash}
+                        for a in s.query(LostAnimal).filter(LostAnimal.id.in_(ids))}
+
+        def build_lost(a):
+            info = f"Tutor: {a['owner']}\nOnde foi perdido: {a['lost_location'] or ''}\nDescrição: {a['desc_animal'] or ''}"
+            if a["event_date"]:
+                info += f"\nPerdido em: {a['event_date']:%d/%m/%Y}"
+            if a["latitude"] and a["longitude"]:
+                info += f"\nCoordenadas: {a['latitude']:.6f}, {a['longitude']:.6f}"
+            thumb = ft.Image(src=photo_url(a["photo_hash"]), width=64, height=64, fit=ft.ImageFit.COVER) if a["photo_hash"] else None
+            return ft.Container(ft.ListTile(leading=thumb, title=ft.Text(a["name"]), subtitle=ft.Text(info)), bgcolor=ft.Colors.BLACK12, padding=12, margin=3, border_radius=8)
+
+        def load_founds(ids):
+            with session_scope() as s:
+                return {r.id: {"species": r.species, "finder": r.finder.username if r.finder else "—",
+                               "found_location": r.found_location, "found_description": r.found_description,
+                               "event_date": r.event_date, "latitude": r.latitude, "longitude": r.longitude,
+                               "photo_hash": r.photo_hash}
+                        for r in s.query(FoundReport).filter(FoundReport.id.in_(ids))}
+
+        def build_found(r):
+            info = f"Quem encontrou: {r['finder']}\nOnde foi encontrado: {r['found_location'] or ''}\nDescrição: {r['found_description'] or ''}"
+            if r["event_date"]:
+                info += f"\nEncontrado em: {r['event_date']:%d/%m/%Y}"
+            if r["latitude"] and r["longitude"]:
+                info += f"\nCoordenadas: {r['latitude']:.6f}, {r['longitude']:.6f}"
+            thumb = ft.Image(src=photo_url(r["photo_hash"]), width=64, height=64, fit=ft.ImageFit.COVER) if r["photo_hash"] else None
+            return ft.Container(ft.ListTile(leading=thumb, title=ft.Text(r["species"] or "Animal encontrado"), subtitle=ft.Text(info)), bgcolor=ft.Colors.INDIGO_ACCENT, padding=12, margin=3, border_radius=8)
+
+        lost_list.controls = state["list_items"]["home_lost"].controls(lost_versions, load_losts, build_lost)
+        found_list.controls = state["list_items"]["home_found"].controls(found_versions, load_founds, build_found)
+
+        page.add(header, ft.Row([btn_lost, btn_found, btn_my, btn_map, btn_nearby, btn_history, btn_alerts, btn_logout]), period, chips, ft.Text("Animais perdidos:"), lost_list, ft.Text("Animais encontrados:"), found_list)
+
+    @profiled
     def do_logout(e):
         state["current_user"] = None
         show_login()
 
     # ---------- My posts (view / edit / delete) ----------
+    @profiled
     def show_my_posts(e=None):
         page.controls.clear()
         cur = state["current_user"]
@@ -372,44 +1047,57 @@ def main(page: ft.Page):
         my_lost_list = ft.ListView(expand=True, spacing=8)
         my_found_list = ft.ListView(expand=True, spacing=8)
 
-        # load data inside a session and convert to plain dicts to avoid detached-instance errors
         with session_scope() as s:
-            losts_rows = s.query(LostAnimal).filter_by(owner_id=cur["id"]).order_by(LostAnimal.id.desc()).all()
-            founds_rows = s.query(FoundReport).filter_by(finder_id=cur["id"]).order_by(FoundReport.id.desc()).all()
+            lost_versions = RenderedItems.row_versions(s.query(LostAnimal.id, LostAnimal.version, LostAnimal.reported_at)
+                                                       .filter_by(owner_id=cur["id"]).order_by(LostAnimal.id.desc()).all())
+            found_versions = RenderedItems.row_versions(s.query(FoundReport.id, FoundReport.version, FoundReport.reported_at)
+                                                        .filter_by(finder_id=cur["id"]).order_by(FoundReport.id.desc()).all())
 
-            losts = [{
-                "id": a.id,
-                "name": a.name,
-                "lost_location": a.lost_location,
-                "desc_animal": a.desc_animal,
-                "latitude": a.latitude,
-                "longitude": a.longitude
-            } for a in losts_rows]
-
-            founds = [{
-                "id": r.id,
-                "species": r.species,
-                "found_location": r.found_location,
-                "found_description": r.found_description,
-                "latitude": r.latitude,
-                "longitude": r.longitude
-            } for r in founds_rows]
-
-        if not losts and not founds:
+        if not lost_versions and not found_versions:
             page.add(ft.Text("Você não tem posts ainda."))
             page.add(ft.Row([ft.ElevatedButton("Back", on_click=show_home)]))
             return
 
+        # load data inside a session and convert to plain dicts to avoid detached-instance errors;
+        # only rows that are new or changed since the last visit get here
+        def load_losts(ids):
+            with session_scope() as s:
+                return {a.id: {
+                    "id": a.id,
+                    "name": a.name,
+                    "lost_location": a.lost_location,
+                    "desc_animal": a.desc_animal,
+                    "latitude": a.latitude,
+                    "longitude": a.longitude,
+                    "photo_hash": a.photo_hash,
+                    "status": a.status
+                } for a in s.query(LostAnimal).filter(LostAnimal.id.in_(ids))}
+
+        def load_founds(ids):
+            with session_scope() as s:
+                return {r.id: {
+                    "id": r.id,
+                    "species": r.species,
+                    "found_location": r.found_location,
+                    "found_description": r.found_description,
+                    "latitude": r.latitude,
+                    "longitude": r.longitude,
+                    "photo_hash": r.photo_hash,
+                    "status": r.status
+                } for r in s.query(FoundReport).filter(FoundReport.id.in_(ids))}
+
         # build lost list items
-        for ld in losts:
-            info = f"{ld['name']} — {ld['lost_location'] or ''}\n{ld['desc_animal'] or ''}"
+        def build_lost(ld):
+            info = f"{ld['name']} — {ld['lost_location'] or ''}\n{ld['desc_animal'] or ''}\nSituação: {STATUS_LABELS[ld['status']]}"
             if ld['latitude'] and ld['longitude']:
                 info += f"\nCoords: {ld['latitude']:.6f}, {ld['longitude']:.6f}"
             item = ft.Container(
                 ft.Row([
+                    ft.Image(src=photo_url(ld['photo_hash']), width=64, height=64, fit=ft.ImageFit.COVER) if ld['photo_hash'] else ft.Container(width=0),
                     ft.Column([ft.Text(ld['name'], weight=ft.FontWeight.BOLD), ft.Text(info)], expand=True),
                     ft.Column([
                         ft.ElevatedButton("Editar", on_click=lambda e, aid=ld['id']: show_edit_lost(aid)),
+                        ft.TextButton("Parecidos", visible=bool(ld['photo_hash']), on_click=lambda e, aid=ld['id']: show_similar("lost", aid)),
                         ft.TextButton("Deletar", on_click=lambda e, aid=ld['id']: confirm_delete_lost(aid))
                     ])
                 ]),
@@ -418,18 +1106,20 @@ def main(page: ft.Page):
                 margin=3,
                 border_radius=8
             )
-            my_lost_list.controls.append(item)
+            return item
 
         # build found list items
-        for fd in founds:
-            info = f"{fd['species'] or 'Animal encontrado'} — {fd['found_location'] or ''}\n{fd['found_description'] or ''}"
+        def build_found(fd):
+            info = f"{fd['species'] or 'Animal encontrado'} — {fd['found_location'] or ''}\n{fd['found_description'] or ''}\nSituação: {STATUS_LABELS[fd['status']]}"
             if fd['latitude'] and fd['longitude']:
                 info += f"\nCoords: {fd['latitude']:.6f}, {fd['longitude']:.6f}"
             item = ft.Container(
                 ft.Row([
+                    ft.Image(src=photo_url(fd['photo_hash']), width=64, height=64, fit=ft.ImageFit.COVER) if fd['photo_hash'] else ft.Container(width=0),
                     ft.Column([ft.Text(fd['species'] or "Animal encontrado", weight=ft.FontWeight.BOLD), ft.Text(info)], expand=True),
                     ft.Column([
                         ft.ElevatedButton("Edit", on_click=lambda e, rid=fd['id']: show_edit_found(rid)),
+                        ft.TextButton("Parecidos", visible=bool(fd['photo_hash']), on_click=lambda e, rid=fd['id']: show_similar("found", rid)),
                         ft.TextButton("Delete", on_click=lambda e, rid=fd['id']: confirm_delete_found(rid))
                     ])
                 ]),
@@ -438,11 +1128,18 @@ def main(page: ft.Page):
                 margin=3,
                 border_radius=8
             )
-            my_found_list.controls.append(item)
+            return item
 
+        my_lost_list.controls = state["list_items"]["my_lost"].controls(lost_versions, load_losts, build_lost)
+        my_found_list.controls = state["list_items"]["my_found"].controls(found_versions, load_founds, build_found)
         page.add(ft.Text("Meus animais perdidos"), my_lost_list, ft.Text("Animais que encontrei"), my_found_list, ft.Row([ft.ElevatedButton("Voltar", on_click=show_home)]))
 
+    def status_dropdown(value):
+        return ft.Dropdown(label="Situação", width=200, value=value or "open",
+                           options=[ft.dropdown.Option(s, STATUS_LABELS[s]) for s in REPORT_STATUSES])
+
     # Edit lost
+    @profiled
     def show_edit_lost(lost_id):
         page.controls.clear()
         cur = state["current_user"]
@@ -464,8 +1161,11 @@ def main(page: ft.Page):
                 "lost_location": a.lost_location,
                 "desc_animal": a.desc_animal,
                 "contact": a.contact,
+                "event_date": a.event_date,
                 "latitude": a.latitude,
-                "longitude": a.longitude
+                "longitude": a.longitude,
+                "photo_hash": a.photo_hash,
+                "status": a.status
             }
 
         name = ft.TextField(label="Nome do animal", value=a_data["name"] or "")
@@ -473,34 +1173,17 @@ def main(page: ft.Page):
         location = ft.TextField(label="Local", value=a_data["lost_location"] or "")
         desc = ft.TextField(label="Descrição (opcional)", value=a_data["desc_animal"] or "")
         contact = ft.TextField(label="Contato (opcional)", value=a_data["contact"] or "")
+        date = ft.TextField(label="Quando foi perdido (opcional)", value=f"{a_data['event_date']:%d/%m/%Y}" if a_data["event_date"] else "")
         lat_field = ft.TextField(label="Latitude (opcional)", value=f"{a_data['latitude']:.6f}" if a_data['latitude'] is not None else "")
         lon_field = ft.TextField(label="Longitude (opcional)", value=f"{a_data['longitude']:.6f}" if a_data['longitude'] is not None else "")
-        preview_image = ft.Image(src="", width=600, height=300)
-        preview_address = ft.Text("", selectable=True)
+        preview = MapPreview(page, lat_field, lon_field)
+        autocomplete = AddressAutocomplete(page, location, lat_field, lon_field, preview)
+        photo = PhotoPicker(page, a_data["photo_hash"])
+        status = status_dropdown(a_data["status"])
         msg = ft.Text("")
 
-        def update_preview_from_fields():
-            try:
-                if lat_field.value.strip() and lon_field.value.strip():
-                    lat = float(lat_field.value.strip()); lon = float(lon_field.value.strip())
-                    preview_image.src = build_static_map_url(lat, lon)
-                    preview_address.value = reverse_geocode(lat, lon) or "Endereço não encontrado"
-                else:
-                    preview_image.src = ""
-                    preview_address.value = ""
-            except Exception:
-                preview_image.src = ""
-                preview_address.value = ""
-            try:
-                preview_image.update()
-            except:
-                pass
-            try:
-                preview_address.update()
-            except:
-                pass
-            page.update()
 
+        @profiled
         def do_update(ev):
             if not name.value.strip():
                 msg.value = "Nome é obrigatório"
@@ -513,6 +1196,11 @@ def main(page: ft.Page):
                 msg.value = "Coordenadas inválidas"
                 page.update()
                 return
+            event_date = parse_free_date(date.value)
+            if date.value.strip() and event_date is None:
+                msg.value = "Data não reconhecida (use dd/mm/aaaa)"
+                page.update()
+                return
             with session_scope() as s:
                 obj = s.query(LostAnimal).filter_by(id=lost_id, owner_id=cur["id"]).first()
                 if not obj:
@@ -524,24 +1212,29 @@ def main(page: ft.Page):
                 obj.lost_location = location.value.strip() or None
                 obj.desc_animal = desc.value.strip() or None
                 obj.contact = contact.value.strip() or None
+                obj.event_date = event_date
                 obj.latitude = lat
                 obj.longitude = lon
+                obj.photo_hash = photo.photo_hash
+                obj.status = status.value
                 s.add(obj)
+            get_address_index().add(location.value, lat, lon)
             show_snack("Registro atualizado")
             show_my_posts()
 
         page.add(ft.Text("Editar Registro de animal perdido", size=18),
-                 name, species, location, desc, contact,
+                 name, species, location, autocomplete.suggestions, desc, contact, date, status, photo.row,
                  ft.Row([lat_field, lon_field]),
-                 ft.Row([ft.ElevatedButton("Atualizar mapa", on_click=lambda e: update_preview_from_fields()),
+                 ft.Row([ft.ElevatedButton("Atualizar mapa", on_click=lambda e: preview.refresh()),
                          ft.ElevatedButton("Salvar mudanças", on_click=do_update),
                          ft.TextButton("Cancelar", on_click=lambda e: show_my_posts())]),
-                 preview_image, preview_address, msg)
+                 preview.image, preview.address, msg)
 
         # initial preview
-        update_preview_from_fields()
+        preview.refresh()
 
     # Edit found
+    @profiled
     def show_edit_found(found_id):
         page.controls.clear()
         cur = state["current_user"]
@@ -563,7 +1256,9 @@ def main(page: ft.Page):
                 "found_date": r.found_date,
                 "found_description": r.found_description,
                 "latitude": r.latitude,
-                "longitude": r.longitude
+                "longitude": r.longitude,
+                "photo_hash": r.photo_hash,
+                "status": r.status
             }
 
         species = ft.TextField(label="Espécia (opcional)", value=r_data["species"] or "")
@@ -572,32 +1267,14 @@ def main(page: ft.Page):
         desc = ft.TextField(label="Descrição", value=r_data["found_description"] or "")
         lat_field = ft.TextField(label="Latitude (opcional)", value=f"{r_data['latitude']:.6f}" if r_data['latitude'] is not None else "")
         lon_field = ft.TextField(label="Longitude (opcional)", value=f"{r_data['longitude']:.6f}" if r_data['longitude'] is not None else "")
-        preview_image = ft.Image(src="", width=600, height=300)
-        preview_address = ft.Text("", selectable=True)
+        preview = MapPreview(page, lat_field, lon_field)
+        autocomplete = AddressAutocomplete(page, location, lat_field, lon_field, preview)
+        photo = PhotoPicker(page, r_data["photo_hash"])
+        status = status_dropdown(r_data["status"])
         msg = ft.Text("")
 
-        def update_preview_from_fields():
-            try:
-                if lat_field.value.strip() and lon_field.value.strip():
-                    lat = float(lat_field.value.strip()); lon = float(lon_field.value.strip())
-                    preview_image.src = build_static_map_url(lat, lon)
-                    preview_address.value = reverse_geocode(lat, lon) or "Endereço não encontrado"
-                else:
-                    preview_image.src = ""
-                    preview_address.value = ""
-            except Exception:
-                preview_image.src = ""
-                preview_address.value = ""
-            try:
-                preview_image.update()
-            except:
-                pass
-            try:
-                preview_address.update()
-            except:
-                pass
-            page.update()
 
+        @profiled
         def do_update(ev):
             try:
                 lat = float(lat_field.value.strip()) if lat_field.value.strip() else None
@@ -606,6 +1283,15 @@ def main(page: ft.Page):
                 msg.value = "Coordenadas inválidas"
                 page.update()
                 return
+            found_date = date.value.strip() or None
+            if found_date and found_date != r_data["found_date"]:
+                # like the lost forms: reject what cannot be parsed, store the resolved date
+                event_date = parse_free_date(found_date)
+                if event_date is None:
+                    msg.value = "Data não reconhecida (use dd/mm/aaaa)"
+                    page.update()
+                    return
+                found_date = event_date.strftime("%d/%m/%Y")
             with session_scope() as s:
                 obj = s.query(FoundReport).filter_by(id=found_id, finder_id=cur["id"]).first()
                 if not obj:
@@ -614,25 +1300,29 @@ def main(page: ft.Page):
                     return
                 obj.species = species.value.strip() or None
                 obj.found_location = location.value.strip() or None
-                obj.found_date = date.value.strip() or None
+                obj.found_date = found_date
                 obj.found_description = desc.value.strip() or None
                 obj.latitude = lat
                 obj.longitude = lon
+                obj.photo_hash = photo.photo_hash
+                obj.status = status.value
                 s.add(obj)
+            get_address_index().add(location.value, lat, lon)
             show_snack("Found report updated.")
             show_my_posts()
 
         page.add(ft.Text("Edit Found Report", size=18),
-                 species, location, date, desc,
+                 species, location, autocomplete.suggestions, date, desc, status, photo.row,
                  ft.Row([lat_field, lon_field]),
-                 ft.Row([ft.ElevatedButton("Atualizar mapa", on_click=lambda e: update_preview_from_fields()),
+                 ft.Row([ft.ElevatedButton("Atualizar mapa", on_click=lambda e: preview.refresh()),
                          ft.ElevatedButton("Salvar mudanças", on_click=do_update),
                          ft.TextButton("Cancelar", on_click=lambda e: show_my_posts())]),
-                 preview_image, preview_address, msg)
+                 preview.image, preview.address, msg)
 
-        update_preview_from_fields()
+        preview.refresh()
 
     # Delete confirmation and handlers
+    @profiled
     def confirm_delete_lost(lost_id):
         dlg = ft.AlertDialog(
             title=ft.Text("Deletar registro de animal perdido?"),
@@ -657,10 +1347,11 @@ def main(page: ft.Page):
             page.dialog = None
             page.update()
 
+    @profiled
     def confirm_delete_lost(lost_id):
         # Use a wrapper so we capture the id correctly
-        def on_delete_click(e, lid=lost_id):
-            _do_delete_lost(lid)
+        async def on_delete_click(e, lid=lost_id):
+            await _do_delete_lost(lid)
 
         dlg = ft.AlertDialog(
             title=ft.Text("Deletar registro de animal perdido?"),
@@ -675,8 +1366,9 @@ def main(page: ft.Page):
         dlg.open = True
         page.update()
 
-    def _do_delete_lost(lost_id):
-        # internal: perform deletion in a fresh session and refresh UI
+    @profiled
+    async def _do_delete_lost(lost_id):
+        # internal: perform deletion in a fresh async session and refresh UI
         close_dialog()
         cur = state.get("current_user")
         if not cur:
@@ -685,20 +1377,19 @@ def main(page: ft.Page):
             return
 
         try:
-            with session_scope() as s:
-                # load by primary key and verify ownership
-                obj = s.get(LostAnimal, int(lost_id))
-                if not obj or obj.owner_id != cur["id"]:
-                    show_snack("Registro não encontrado", success=False)
-                    return
-                s.delete(obj)
+            # loads by primary key and verifies ownership
+            if not await repo.delete_lost(lost_id, cur["id"]):
+                show_snack("Registro não encontrado", success=False)
+                return
             show_snack("Registro deletado.")
         except Exception as ex:
             print("Error deleting lost report:", ex)
             show_snack("Failed to delete lost report.", success=False)
 
-        show_my_posts()
+        # async handlers run on the event loop: build the (sync, query-heavy) screen in a worker thread
+        await asyncio.to_thread(show_my_posts)
 
+    @profiled
     def confirm_delete_found(found_id):
         def on_delete_click(e, fid=found_id):
             _do_delete_found(fid)
@@ -716,6 +1407,7 @@ def main(page: ft.Page):
         dlg.open = True
         page.update()
 
+    @profiled
     def _do_delete_found(found_id):
         close_dialog()
         cur = state.get("current_user")
@@ -738,13 +1430,17 @@ def main(page: ft.Page):
 
         show_my_posts()
 
+    @profiled
     def confirm_delete_found(found_id):
+        async def on_delete_click(e, fid=found_id):
+            await do_delete_found(fid)
+
         dlg = ft.AlertDialog(
             title=ft.Text("Deletar registro de animal encontrado?"),
             content=ft.Text("Esta ação não pode ser desfeita."),
             actions=[
                 ft.TextButton("Cancel", on_click=lambda e: close_dialog()),
-                ft.ElevatedButton("Delete", bgcolor=ft.Colors.RED, on_click=lambda e: do_delete_found(found_id))
+                ft.ElevatedButton("Delete", bgcolor=ft.Colors.RED, on_click=on_delete_click)
             ],
             actions_alignment=ft.MainAxisAlignment.END
         )
@@ -752,25 +1448,79 @@ def main(page: ft.Page):
         dlg.open = True
         page.update()
 
-    def do_delete_found(found_id):
+    @profiled
+    async def do_delete_found(found_id):
         close_dialog()
         cur = state["current_user"]
-        with session_scope() as s:
-            obj = s.query(FoundReport).filter_by(id=found_id, finder_id=cur["id"]).first()
-            if not obj:
+        try:
+            if await repo.delete_found(found_id, cur["id"]):
+                show_snack("Registro deletado.")
+            else:
                 show_snack("Registro não encontrado", success=False)
-                show_my_posts()
-                return
-            s.delete(obj)
-        show_snack("Registro deletado.")
-        show_my_posts()
+        except Exception as ex:
+            print("Error deleting found report:", ex)
+            show_snack("Failed to delete found report.", success=False)
+        # async handlers run on the event loop: build the (sync, query-heavy) screen in a worker thread
+        await asyncio.to_thread(show_my_posts)
 
     def close_dialog():
         if getattr(page, "dialog", None):
             page.dialog.open = False
             page.update()
 
+    # ---------- Duplicate check before saving a new report ----------
+    def merge_report_fields(obj, fields, lat, lon):
+        # keep the existing values where the new submission left a field empty
+        for key, value in fields.items():
+            if value:
+                setattr(obj, key, value)
+        if lat is not None and lon is not None:
+            obj.latitude = lat
+            obj.longitude = lon
+
+    def confirm_possible_duplicate(kind, matches, on_save, on_merge):
+        similarity, report_id = matches[0]
+        with session_scope() as s:
+            if kind == "lost":
+                obj = s.get(LostAnimal, report_id)
+                title, where, owner_id = (obj.name, obj.lost_location, obj.owner_id) if obj else (None, None, None)
+            else:
+                obj = s.get(FoundReport, report_id)
+                title, where, owner_id = (obj.species or "Animal encontrado", obj.found_location, obj.finder_id) if obj else (None, None, None)
+        if title is None:
+            on_save()
+            return
+        mine = owner_id == state["current_user"]["id"]
+
+        def save_anyway(e):
+            close_dialog()
+            on_save()
+
+        def merge(e):
+            close_dialog()
+            on_merge(report_id)
+
+        text = f"Parece com '{title}' ({where or 'local não informado'}), {similarity:.0%} de semelhança."
+        if mine:
+            text += "\nEsse registro é seu: você pode atualizá-lo em vez de criar outro."
+        else:
+            text += "\nVerifique se não é o mesmo animal antes de salvar."
+        actions = [ft.TextButton("Cancelar", on_click=lambda e: close_dialog())]
+        if mine:
+            actions.append(ft.ElevatedButton("Atualizar o existente", on_click=merge))
+        actions.append(ft.ElevatedButton("Salvar mesmo assim", on_click=save_anyway))
+        dlg = ft.AlertDialog(
+            title=ft.Text("Possível registro duplicado"),
+            content=ft.Text(text),
+            actions=actions,
+            actions_alignment=ft.MainAxisAlignment.END
+        )
+        page.dialog = dlg
+        dlg.open = True
+        page.update()
+
     # ---------- Lost / Found registration (unchanged flow but improve confirmations) ----------
+    @profiled
     def show_lost_registration(e=None):
         page.controls.clear()
         cur = state["current_user"]
@@ -782,35 +1532,16 @@ def main(page: ft.Page):
         location = ft.TextField(label="Onde foi perdido (endereço ou descrição)")
         desc = ft.TextField(label="Descrição do animal (opcional)")
         contact = ft.TextField(label="Contato (opcional)")
+        date = ft.TextField(label="Quando foi perdido (opcional, ex.: ontem, 12/03)")
         lat_field = ft.TextField(label="Latitude (opcional)")
         lon_field = ft.TextField(label="Longitude (opcional)")
         msg = ft.Text("")
 
-        preview_image = ft.Image(src="", width=600, height=300)
-        preview_address = ft.Text("", selectable=True)
-
-        def update_preview_from_fields():
-            try:
-                if lat_field.value.strip() and lon_field.value.strip():
-                    lat = float(lat_field.value.strip()); lon = float(lon_field.value.strip())
-                    preview_image.src = build_static_map_url(lat, lon)
-                    preview_address.value = reverse_geocode(lat, lon) or "No address found for these coordinates."
-                else:
-                    preview_image.src = ""
-                    preview_address.value = ""
-            except Exception:
-                preview_image.src = ""
-                preview_address.value = ""
-            try:
-                preview_image.update()
-            except:
-                pass
-            try:
-                preview_address.update()
-            except:
-                pass
-            page.update()
+        preview = MapPreview(page, lat_field, lon_field, not_found_text="No address found for these coordinates.")
+        autocomplete = AddressAutocomplete(page, location, lat_field, lon_field, preview)
+        photo = PhotoPicker(page)
 
+        @profiled
         def do_register_lost(ev):
             if not name.value.strip():
                 msg.value = "Nome é obrigatório"
@@ -828,29 +1559,54 @@ def main(page: ft.Page):
                     return
             else:
                 lat, lon = geocode_address(location.value.strip())
+            event_date = parse_free_date(date.value)
+            if date.value.strip() and event_date is None:
+                msg.value = "Data não reconhecida (use dd/mm/aaaa)"
+                page.update()
+                return
 
-            with session_scope() as s:
-                la = LostAnimal(
-                    name=name.value.strip(),
-                    species=species.value.strip() or None,
-                    lost_location=location.value.strip() or None,
-                    desc_animal=desc.value.strip() or None,
-                    contact=contact.value.strip() or None,
-                    owner_id=cur["id"],
-                    latitude=lat,
-                    longitude=lon
-                )
-                s.add(la)
-            show_snack("Animal perdido registrado.")
-            # clear form fields
-            name.value = species.value = location.value = desc.value = contact.value = ""
-            lat_field.value = lon_field.value = ""
-            update_preview_from_fields()
-            page.update()
+            fields = {
+                "name": name.value.strip(),
+                "species": species.value.strip() or None,
+                "lost_location": location.value.strip() or None,
+                "desc_animal": desc.value.strip() or None,
+                "contact": contact.value.strip() or None,
+                "photo_hash": photo.photo_hash,
+                "event_date": event_date,
+            }
+
+            def clear_form():
+                name.value = species.value = location.value = desc.value = contact.value = date.value = ""
+                lat_field.value = lon_field.value = ""
+                photo.clear()
+                preview.refresh()
+                page.update()
+
+            def save():
+                with session_scope() as s:
+                    la = LostAnimal(owner_id=cur["id"], latitude=lat, longitude=lon, **fields)
+                    s.add(la)
+                get_address_index().add(location.value, lat, lon)
+                show_snack("Animal perdido registrado.")
+                clear_form()
 
+            def merge(existing_id):
+                with session_scope() as s:
+                    obj = s.get(LostAnimal, existing_id)
+                    if obj and obj.owner_id == cur["id"]:
+                        merge_report_fields(obj, fields, lat, lon)
+                show_snack("Registro existente atualizado.")
+                clear_form()
+
+            matches = find_duplicates("lost", fields, lat, lon)
+            if matches:
+                confirm_possible_duplicate("lost", matches, save, merge)
+                return
+            save()
+
+        @profiled
         def fetch_picked_coords(ev):
-            lat = LAST_PICK.get("lat")
-            lon = LAST_PICK.get("lon")
+            lat, lon = get_pick(state["session_token"])
             if lat is None or lon is None:
                 msg.value = "Coordenadas não selecionadas ainda — clique no mapa primeiro."
             else:
@@ -858,20 +1614,21 @@ def main(page: ft.Page):
                 lon_field.value = f"{lon:.6f}"
                 msg.value = "Coordenadas importadas para o formulário."
                 # automatically refresh preview and reverse-geocode
-                update_preview_from_fields()
+                preview.refresh()
             page.update()
 
         page.add(ft.Text("Register Lost Animal", size=18),
-                 name, species, location, desc, contact,
+                 name, species, location, autocomplete.suggestions, desc, contact, date, photo.row,
                  ft.Row([lat_field, lon_field]),
                  ft.Row([ft.ElevatedButton("Atualizar coordenadas selecionadas", on_click=fetch_picked_coords),
-                         ft.ElevatedButton("Atualizar mapa", on_click=lambda e: (update_preview_from_fields())),
+                         ft.ElevatedButton("Atualizar mapa", on_click=lambda e: preview.refresh()),
                          ft.ElevatedButton("Salvar", on_click=do_register_lost),
                          ft.TextButton("Voltar", on_click=show_home)]),
-                 preview_image,
-                 preview_address,
+                 preview.image,
+                 preview.address,
                  msg)
 
+    @profiled
     def show_found_registration(e=None):
         page.controls.clear()
         cur = state["current_user"]
@@ -886,31 +1643,11 @@ def main(page: ft.Page):
         lon_field = ft.TextField(label="Longitude (opcional)")
         msg = ft.Text("")
 
-        preview_image = ft.Image(src="", width=600, height=300)
-        preview_address = ft.Text("", selectable=True)
-
-        def update_preview_from_fields():
-            try:
-                if lat_field.value.strip() and lon_field.value.strip():
-                    lat = float(lat_field.value.strip()); lon = float(lon_field.value.strip())
-                    preview_image.src = build_static_map_url(lat, lon)
-                    preview_address.value = reverse_geocode(lat, lon) or "No address found for these coordinates."
-                else:
-                    preview_image.src = ""
-                    preview_address.value = ""
-            except Exception:
-                preview_image.src = ""
-                preview_address.value = ""
-            try:
-                preview_image.update()
-            except:
-                pass
-            try:
-                preview_address.update()
-            except:
-                pass
-            page.update()
+        preview = MapPreview(page, lat_field, lon_field, not_found_text="No address found for these coordinates.")
+        autocomplete = AddressAutocomplete(page, location, lat_field, lon_field, preview)
+        photo = PhotoPicker(page)
 
+        @profiled
         def do_register_found(ev):
             lat = None; lon = None
             if lat_field.value.strip() and lon_field.value.strip():
@@ -923,64 +1660,384 @@ def main(page: ft.Page):
                     return
             else:
                 lat, lon = geocode_address(location.value.strip())
+            event_date = parse_free_date(date.value)
+            if date.value.strip() and event_date is None:
+                msg.value = "Data não reconhecida (use dd/mm/aaaa)"
+                page.update()
+                return
 
-            with session_scope() as s:
-                fr = FoundReport(
-                    species=species.value.strip() or None,
-                    found_location=location.value.strip() or None,
-                    found_date=date.value.strip() or None,
-                    found_description=desc.value.strip() or None,
-                    finder_id=cur["id"],
-                    latitude=lat,
-                    longitude=lon
-                )
-                s.add(fr)
-            show_snack("Registro de animal encontrado salvo.")
-            # clear fields
-            species.value = location.value = date.value = desc.value = ""
-            lat_field.value = lon_field.value = ""
-            update_preview_from_fields()
-            page.update()
+            fields = {
+                "species": species.value.strip() or None,
+                "found_location": location.value.strip() or None,
+                "found_date": event_date.strftime("%d/%m/%Y") if event_date else None,
+                "found_description": desc.value.strip() or None,
+                "photo_hash": photo.photo_hash,
+            }
+
+            def clear_form():
+                species.value = location.value = date.value = desc.value = ""
+                lat_field.value = lon_field.value = ""
+                photo.clear()
+                preview.refresh()
+                page.update()
+
+            def save():
+                with session_scope() as s:
+                    fr = FoundReport(finder_id=cur["id"], latitude=lat, longitude=lon, **fields)
+                    s.add(fr)
+                get_address_index().add(location.value, lat, lon)
+                show_snack("Registro de animal encontrado salvo.")
+                clear_form()
 
+            def merge(existing_id):
+                with session_scope() as s:
+                    obj = s.get(FoundReport, existing_id)
+                    if obj and obj.finder_id == cur["id"]:
+                        merge_report_fields(obj, fields, lat, lon)
+                show_snack("Registro existente atualizado.")
+                clear_form()
+
+            matches = find_duplicates("found", fields, lat, lon)
+            if matches:
+                confirm_possible_duplicate("found", matches, save, merge)
+                return
+            save()
+
+        @profiled
         def fetch_picked_coords(ev):
-            lat = LAST_PICK.get("lat")
-            lon = LAST_PICK.get("lon")
+            lat, lon = get_pick(state["session_token"])
             if lat is None or lon is None:
                 msg.value = "Coordenadas não selecionadas ainda — clique no mapa primeiro."
             else:
                 lat_field.value = f"{lat:.6f}"
                 lon_field.value = f"{lon:.6f}"
                 msg.value = "Coordenadas importadas para o formulário."
-                update_preview_from_fields()
+                preview.refresh()
             page.update()
 
         page.add(ft.Text("Registrar animal encontrado", size=18),
-                 species, location, date, desc,
+                 species, location, autocomplete.suggestions, date, desc, photo.row,
                  ft.Row([lat_field, lon_field]),
                  ft.Row([ft.ElevatedButton("Atualizar coordenadas selecionadas", on_click=fetch_picked_coords),
-                         ft.ElevatedButton("Atualizar mapa", on_click=lambda e: (update_preview_from_fields())),
+                         ft.ElevatedButton("Atualizar mapa", on_click=lambda e: preview.refresh()),
                          ft.ElevatedButton("Salvar", on_click=do_register_found),
                          ft.TextButton("Voltar", on_click=show_home)]),
-                 preview_image,
-                 preview_address,
+                 preview.image,
+                 preview.address,
                  msg)
 
+    # ---------- Similar animals (photo similarity) ----------
+    @profiled
+    def show_similar(kind, report_id):
+        page.controls.clear()
+        cur = state["current_user"]
+        if not cur:
+            show_login()
+            return
+        model = LostAnimal if kind == "lost" else FoundReport
+        with session_scope() as s:
+            obj = s.get(model, report_id)
+            if not obj or not obj.photo_hash:
+                show_snack("Registro sem foto", success=False)
+                show_my_posts()
+                return
+            content_hash, lat, lon = obj.photo_hash, obj.latitude, obj.longitude
+            title = obj.name if kind == "lost" else (obj.species or "Animal encontrado")
+        # finders look for matching lost animals and owners for matching found ones
+        target = ("found",) if kind == "lost" else ("lost",)
+        only_near = ft.Checkbox(label="Somente próximos", value=False, disabled=lat is None or lon is None)
+        radius_field = ft.TextField(label="Raio (km)", value="10", width=120)
+        results = ft.ListView(expand=True, spacing=8)
+        msg = ft.Text("")
+
+        @profiled
+        def do_search(ev=None):
+            radius = None
+            if only_near.value:
+                try:
+                    radius = float(radius_field.value)
+                except ValueError:
+                    msg.value = "Raio inválido"
+                    page.update()
+                    return
+            try:
+                rows = similar_reports(content_hash, kinds=target,
+                                       near=(lat, lon) if lat is not None and lon is not None else None,
+                                       radius_km=radius, exclude=(kind, report_id))
+            except Exception as ex:
+                print("Similarity search error:", ex)
+                msg.value = "Não foi possível comparar as fotos."
+                page.update()
+                return
+            results.controls.clear()
+            for row in rows:
+                info = f"{row['similarity']:.0%} parecido — {row['location'] or ''}"
+                if row["distance_km"] is not None:
+                    info += f" ({row['distance_km']:.1f} km)"
+                results.controls.append(ft.Container(
+                    ft.ListTile(leading=ft.Image(src=photo_url(row["photo_hash"]), width=64, height=64, fit=ft.ImageFit.COVER),
+                                title=ft.Text(row["title"]), subtitle=ft.Text(info)),
+                    bgcolor=ft.Colors.BLACK12 if row["kind"] == "lost" else ft.Colors.INDIGO_ACCENT,
+                    padding=12, margin=3, border_radius=8))
+            msg.value = f"{len(rows)} animal(is) parecido(s)." if rows else "Nenhum animal parecido encontrado."
+            page.update()
+
+        page.add(ft.Text(f"Animais parecidos com '{title}'", size=18),
+                 ft.Row([ft.Image(src=photo_url(content_hash, "md"), width=200, height=200, fit=ft.ImageFit.CONTAIN)]),
+                 ft.Row([only_near, radius_field,
+                         ft.ElevatedButton("Buscar", on_click=do_search),
+                         ft.TextButton("Voltar", on_click=show_my_posts)]),
+                 msg, results)
+        do_search()
+
+    # ---------- Archived cases ----------
+    @profiled
+    def show_history(e=None):
+        page.controls.clear()
+        cur = state["current_user"]
+        if not cur:
+            show_login()
+            return
+        query = ft.TextField(label="Buscar no histórico (nome, espécie, local...)", expand=True)
+        results = ft.ListView(expand=True, spacing=8)
+        msg = ft.Text("")
+
+        @profiled
+        def do_search(ev=None):
+            rows = search_archive(query.value)
+            results.controls.clear()
+            for row in rows:
+                info = f"{STATUS_LABELS.get(row['status'], 'Sem atualização')} — {row['location'] or ''}\n{row['desc'] or ''}"
+                if row["archived_at"]:
+                    info += f"\nArquivado em: {row['archived_at']:%d/%m/%Y}"
+                results.controls.append(ft.Container(
+                    ft.ListTile(title=ft.Text(row["title"]), subtitle=ft.Text(info)),
+                    bgcolor=ft.Colors.BLACK12 if row["kind"] == "lost" else ft.Colors.INDIGO_ACCENT,
+                    padding=12, margin=3, border_radius=8))
+            msg.value = f"{len(rows)} caso(s) arquivado(s)." if rows else "Nenhum caso arquivado encontrado."
+            page.update()
+
+        query.on_submit = do_search
+        page.add(ft.Text("Histórico de casos", size=18),
+                 ft.Row([query, ft.ElevatedButton("Buscar", on_click=do_search),
+                         ft.TextButton("Voltar", on_click=show_home)]),
+                 msg, results)
+        do_search()
+
+    # ---------- Area alerts ----------
+    @profiled
+    def show_alerts(e=None):
+        page.controls.clear()
+        cur = state["current_user"]
+        if not cur:
+            show_login()
+            return
+        label = ft.TextField(label="Nome da área (ex.: perto de casa)")
+        lat_field = ft.TextField(label="Latitude do centro")
+        lon_field = ft.TextField(label="Longitude do centro")
+        radius_field = ft.TextField(label="Raio (km)", value="2")
+        polygon_field = ft.TextField(label="Ou polígono: lat,lon; lat,lon; lat,lon (opcional)")
+        species = ft.TextField(label="Espécie (opcional)")
+        kind = ft.Dropdown(label="Avisar sobre", value="all", options=[
+            ft.dropdown.Option("all", "Perdidos e encontrados"),
+            ft.dropdown.Option("found", "Animais encontrados"),
+            ft.dropdown.Option("lost", "Animais perdidos")])
+        msg = ft.Text("")
+        subs_list = ft.ListView(spacing=6, height=180)
+        notes_list = ft.ListView(expand=True, spacing=6)
+
+        with session_scope() as s:
+            subs = [(sub.id, sub.label, sub.radius_km, sub.polygon is not None, sub.species)
+                    for sub in s.query(AreaSubscription).filter_by(user_id=cur["id"]).order_by(AreaSubscription.id.desc())]
+            notes = s.query(Notification).filter_by(user_id=cur["id"]).order_by(Notification.id.desc()).limit(50).all()
+            notes = [(n.message, n.created_at, n.read) for n in notes]
+            # opening the screen marks everything as read
+            s.query(Notification).filter_by(user_id=cur["id"], read=False).update({"read": True})
+
+        for sid, sub_label, radius, is_polygon, sub_species in subs:
+            area = "polígono" if is_polygon else f"raio de {radius:g} km"
+            subs_list.controls.append(ft.Row([
+                ft.Text(f"{sub_label or 'Área sem nome'} — {area}" + (f" — {sub_species}" if sub_species else ""), expand=True),
+                ft.TextButton("Remover", on_click=lambda e, sid=sid: do_delete_subscription(sid))]))
+        for message, created_at, was_read in notes:
+            when = created_at.strftime("%d/%m/%Y %H:%M") if created_at else ""
+            notes_list.controls.append(ft.Container(
+                ft.ListTile(title=ft.Text(message), subtitle=ft.Text(when)),
+                bgcolor=ft.Colors.BLACK12 if was_read else ft.Colors.AMBER_100, padding=8, border_radius=8))
+
+        @profiled
+        def use_picked(ev):
+            lat, lon = get_pick(state["session_token"])
+            if lat is None or lon is None:
+                msg.value = "Coordenadas não selecionadas ainda — clique no mapa primeiro."
+            else:
+                lat_field.value = f"{lat:.6f}"
+                lon_field.value = f"{lon:.6f}"
+                msg.value = "Coordenadas importadas para o formulário."
+            page.update()
+
+        @profiled
+        def do_subscribe(ev):
+            try:
+                polygon = None
+                if polygon_field.value.strip():
+                    polygon = [tuple(float(v) for v in point.split(",")) for point in polygon_field.value.split(";") if point.strip()]
+                    if any(len(p) != 2 for p in polygon):
+                        raise ValueError("pontos devem ser lat,lon")
+                    center = None; radius = None
+                else:
+                    center = (float(lat_field.value.strip()), float(lon_field.value.strip()))
+                    radius = float(radius_field.value.strip())
+                create_subscription(cur["id"], label=label.value.strip() or None, center=center, radius_km=radius,
+                                    polygon=polygon, species=species.value.strip() or None,
+                                    report_kind=None if kind.value == "all" else kind.value)
+            except ValueError as ex:
+                msg.value = f"Área inválida: {ex}"
+                page.update()
+                return
+            show_snack("Alerta criado.")
+            show_alerts()
+
+        @profiled
+        def do_delete_subscription(sid):
+            delete_subscription(cur["id"], sid)
+            show_snack("Alerta removido.")
+            show_alerts()
+
+        page.add(ft.Text("Alertas por área", size=18),
+                 label, ft.Row([lat_field, lon_field, radius_field]), polygon_field,
+                 ft.Row([species, kind]),
+                 ft.Row([ft.ElevatedButton("Usar ponto do mapa", on_click=use_picked),
+                         ft.ElevatedButton("Criar alerta", on_click=do_subscribe),
+                         ft.TextButton("Voltar", on_click=show_home)]),
+                 msg,
+                 ft.Text("Minhas áreas"), subs_list,
+                 ft.Text("Notificações"), notes_list)
+
+    # ---------- Nearby cases ----------
+    @profiled
+    def show_nearby(e=None):
+        page.controls.clear()
+        cur = state["current_user"]
+        if not cur:
+            show_login()
+            return
+        address = ft.TextField(label="Endereço (opcional)")
+        lat_field = ft.TextField(label="Latitude")
+        lon_field = ft.TextField(label="Longitude")
+        radius_field = ft.TextField(label="Raio (km, opcional)", value="5")
+        k_field = ft.TextField(label="Quantidade máxima (opcional)", value="20")
+        kind = ft.Dropdown(label="Tipo", value="all", options=[
+            ft.dropdown.Option("all", "Perdidos e encontrados"),
+            ft.dropdown.Option("lost", "Perdidos"),
+            ft.dropdown.Option("found", "Encontrados")])
+        results = ft.ListView(expand=True, spacing=8)
+        msg = ft.Text("")
+
+        def set_point(lat, lon, note):
+            lat_field.value = f"{lat:.6f}"
+            lon_field.value = f"{lon:.6f}"
+            msg.value = note
+            page.update()
+
+        @profiled
+        def use_picked(ev):
+            lat, lon = get_pick(state["session_token"])
+            if lat is None or lon is None:
+                msg.value = "Coordenadas não selecionadas ainda — clique no mapa primeiro."
+                page.update()
+                return
+            set_point(lat, lon, "Usando o ponto selecionado no mapa.")
+
+        @profiled
+        def use_my_report(ev):
+            with session_scope() as s:
+                mine = []
+                a = s.query(LostAnimal).filter(LostAnimal.owner_id == cur["id"], LostAnimal.latitude.isnot(None),
+                                               LostAnimal.longitude.isnot(None)).order_by(LostAnimal.id.desc()).first()
+                if a:
+                    mine.append((a.latitude, a.longitude, a.name))
+                r = s.query(FoundReport).filter(FoundReport.finder_id == cur["id"], FoundReport.latitude.isnot(None),
+                                                FoundReport.longitude.isnot(None)).order_by(FoundReport.id.desc()).first()
+                if r:
+                    mine.append((r.latitude, r.longitude, r.species or "Animal encontrado"))
+            if not mine:
+                msg.value = "Você não tem posts com coordenadas."
+                page.update()
+                return
+            lat, lon, title = mine[0]
+            set_point(lat, lon, f"Usando a localização de '{title}'.")
+
+        @profiled
+        def do_search(ev):
+            try:
+                if lat_field.value.strip() and lon_field.value.strip():
+                    lat = float(lat_field.value.strip()); lon = float(lon_field.value.strip())
+                elif address.value.strip():
+                    lat, lon = geocode_address(address.value.strip())
+                    if lat is None:
+                        msg.value = "Endereço não encontrado"
+                        page.update()
+                        return
+                    set_point(lat, lon, "")
+                else:
+                    msg.value = "Informe um endereço ou coordenadas"
+                    page.update()
+                    return
+                radius = float(radius_field.value) if radius_field.value.strip() else None
+                k = int(k_field.value) if k_field.value.strip() else None
+            except ValueError:
+                msg.value = "Valores inválidos"
+                page.update()
+                return
+            kinds = ("lost", "found") if kind.value == "all" else (kind.value,)
+            with session_scope() as s:
+                rows = find_nearby(s, lat, lon, radius_km=radius, k=k, kinds=kinds)
+            results.controls.clear()
+            for row in rows:
+                label = "Perdido" if row["kind"] == "lost" else "Encontrado"
+                info = f"{label} — {row['distance_km']:.2f} km\n{row['location'] or ''}\n{row['desc'] or ''}"
+                results.controls.append(ft.Container(ft.ListTile(title=ft.Text(row["title"]), subtitle=ft.Text(info)),
+                                                     bgcolor=ft.Colors.BLACK12 if row["kind"] == "lost" else ft.Colors.INDIGO_ACCENT,
+                                                     padding=12, margin=3, border_radius=8))
+            msg.value = f"{len(rows)} caso(s) encontrado(s)."
+            page.update()
+
+        page.add(ft.Text("Casos próximos", size=18),
+                 address, ft.Row([lat_field, lon_field]),
+                 ft.Row([radius_field, k_field, kind]),
+                 ft.Row([ft.ElevatedButton("Usar ponto do mapa", on_click=use_picked),
+                         ft.ElevatedButton("Usar meu último post", on_click=use_my_report),
+                         ft.ElevatedButton("Buscar", on_click=do_search),
+                         ft.TextButton("Voltar", on_click=show_home)]),
+                 msg, results)
+
+    @profiled
     def show_map(e=None):
-        port = state["map_port"]
-        map_url = f"http://127.0.0.1:{port}/map.html"
+        map_url = map_url_for_session(state["session_token"])
         try:
-            webbrowser.open(map_url)
+            if page.web:
+                # in web mode the map must open in the user's browser, not on the server
+                page.launch_url(map_url)
+            else:
+                webbrowser.open(map_url)
         except Exception as ex:
             print("Failed to open browser:", ex)
         page.controls.clear()
         page.add(ft.Text("Mapa aberto no seu navegador", size=18),
                  ft.Text("Clique no mapa, retorne ao app e então lique em 'atualizar coordenadas'", selectable=True),
                  ft.Row([ft.ElevatedButton("Voltar", on_click=show_home),
-                         ft.ElevatedButton("Abrir mapa no navegador", on_click=lambda e: webbrowser.open(map_url))]),
+                         ft.ElevatedButton("Abrir mapa no navegador", on_click=lambda e: page.launch_url(map_url) if page.web else webbrowser.open(map_url))]),
                  ft.Text(f"Map URL: {map_url}", selectable=True))
 
     # start UI
     show_login()
+    startup_report("login screen shown")
 
 if __name__ == "__main__":
-    ft.app(target=main)
\ No newline at end of file
+    if os.environ.get("SIARA_WEB") == "1":
+        # multi-session web deployment: every browser tab gets its own main() session
+        ft.app(target=main, view=ft.AppView.WEB_BROWSER, port=int(os.environ.get("SIARA_WEB_PORT", "8550")),
+               upload_dir=str(UPLOAD_DIR))
+    else:
+        ft.app(target=main)
\ No newline at end of file
@@ -0,0 +1,104 @@
+# Moves finished cases (reunited/adopted/closed) and stale open cases out of the live
+# lost_animals/found_reports tables into *_archive tables, so the default queries only
+# scan open cases. Archived history stays searchable through search_archive().
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, and_
+
+from models import (LostAnimal, FoundReport, lost_animals_archive, found_reports_archive,
+                    session_scope, open_only)
+
+ARCHIVE_STALE_DAYS = int(os.environ.get("SIARA_ARCHIVE_STALE_DAYS", "180"))
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get("SIARA_ARCHIVE_INTERVAL_HOURS", "24"))
+BATCH_SIZE = 500
+
+_SOURCES = {
+    "lost": (LostAnimal, lost_animals_archive),
+    "found": (FoundReport, found_reports_archive),
+}
+
+
+def archive_cases(stale_days=ARCHIVE_STALE_DAYS):
+    """Archive closed cases and open cases posted more than `stale_days` ago; returns the count."""
+    cutoff = datetime.utcnow() - timedelta(days=stale_days)
+    moved = 0
+    for kind, (model, archive) in _SOURCES.items():
+        names = [c.name for c in model.__table__.columns]
+        while True:
+            with session_scope() as s:
+                rows = s.query(model).filter(or_(
+                    model.status != "open",
+                    and_(open_only(model), model.reported_at < cutoff),
+                )).limit(BATCH_SIZE).all()
+                if not rows:
+                    break
+                now = datetime.utcnow()
+                s.execute(archive.insert(), [
+                    dict({n: getattr(obj, n) for n in names}, archived_at=now,
+                         archive_reason=obj.status if obj.status != "open" else "stale")
+                    for obj in rows
+                ])
+                # ORM deletes (not a bulk DELETE) so the report listeners see the removals
+                for obj in rows:
+                    s.delete(obj)
+            moved += len(rows)
+    if moved:
+        print(f"Archived {moved} case(s)")
+    return moved
+
+
+def search_archive(text=None, kinds=("lost", "found"), limit=100):
+    """Archived cases whose name/species/description/location contains `text`, newest first."""
+    results = []
+    pattern = f"%{text.strip()}%" if text and text.strip() else None
+    with session_scope() as s:
+        for kind in kinds:
+            model, archive = _SOURCES[kind]
+            c = archive.c
+            if kind == "lost":
+                fields = (c.name, c.species, c.desc_animal, c.lost_location)
+            else:
+                fields = (c.species, c.found_description, c.found_location)
+            q = archive.select().order_by(c.archived_at.desc()).limit(limit)
+            if pattern:
+                q = q.where(or_(*(f.ilike(pattern) for f in fields)))
+            for row in s.execute(q).mappings():
+                results.append({
+                    "kind": kind, "id": row["id"],
+                    "title": row["name"] if kind == "lost" else (row["species"] or "Animal encontrado"),
+                    "location": row["lost_location"] if kind == "lost" else row["found_location"],
+                    "desc": row["desc_animal"] if kind == "lost" else row["found_description"],
+                    "status": row["archive_reason"],
+                    "archived_at": row["archived_at"],
+                })
+    results.sort(key=lambda r: r["archived_at"] or datetime.min, reverse=True)
+    return results[:limit]
+
+
+_archiver_started = False
+_archiver_lock = threading.Lock()
+
+
+def start_archiver(interval_hours=ARCHIVE_INTERVAL_HOURS):
+    """Run archive_cases in a background thread every `interval_hours` (0 disables it).
+    Safe to call from every Flet session; only the first call starts the thread."""
+    global _archiver_started
+    if interval_hours <= 0:
+        return
+    with _archiver_lock:
+        if _archiver_started:
+            return
+        _archiver_started = True
+
+    def loop():
+        while True:
+            try:
+                archive_cases()
+            except Exception as e:
+                print("Archiver error:", e)
+            time.sleep(interval_hours * 3600)
+
+    threading.Thread(target=loop, daemon=True, name="archiver").start()
@@ -0,0 +1,208 @@
+# Awaitable data access for async Flet handlers, next to the synchronous session_scope().
+# Uses SQLAlchemy's asyncio extension over aiosqlite (pip install "sqlalchemy[asyncio]" aiosqlite;
+# the extension needs greenlet, which SQLAlchemy no longer installs by default) against the
+# same database and models, so the mapper/commit events (report listeners, version column,
+# validators) behave exactly as with the sync sessions. Without those packages the same
+# queries run in a worker thread with session_scope(), so callers never block the event loop
+# either way. Results are plain dicts, like the dicts app.py builds from sync sessions, so
+# nothing is lazy-loaded after the session ends.
+#
+# `python async_repository.py <username> <password>` runs every function once against the
+# app database (it creates, edits and deletes one lost report of that user).
+import asyncio
+import functools
+import threading
+from contextlib import asynccontextmanager
+
+from sqlalchemy.orm import sessionmaker
+
+from models import CONN, User, LostAnimal, FoundReport, init_db, session_scope, open_only, reported_since
+
+ASYNC_CONN = CONN.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+LOST_FIELDS = ("name", "species", "lost_location", "desc_animal", "contact", "event_date",
+               "latitude", "longitude", "photo_hash", "status", "reported_at")
+FOUND_FIELDS = ("species", "found_location", "found_date", "found_description", "event_date",
+                "latitude", "longitude", "photo_hash", "status", "reported_at")
+
+# the async engine (and aiosqlite) is only created on the first awaited query
+_async_session = None
+_engine_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def async_driver_available():
+    try:
+        import greenlet  # noqa: F401  (required by sqlalchemy.ext.asyncio)
+        import aiosqlite  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _get_sessionmaker():
+    global _async_session
+    if _async_session is None:
+        with _engine_lock:
+            if _async_session is None:
+                if not async_driver_available():
+                    raise ImportError("async database access needs: pip install \"sqlalchemy[asyncio]\" aiosqlite")
+                from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+                engine = create_async_engine(ASYNC_CONN)
+                _async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    return _async_session
+
+
+@asynccontextmanager
+async def async_session_scope():
+    """Async counterpart of models.session_scope()."""
+    await asyncio.to_thread(init_db)
+    s = _get_sessionmaker()()
+    try:
+        yield s
+        await s.commit()
+    except:
+        await s.rollback()
+        raise
+    finally:
+        await s.close()
+
+
+def _in_session_scope(fn, *args):
+    with session_scope() as s:
+        return fn(s, *args)
+
+
+async def _run(fn, *args):
+    """fn(session, *args) in one transaction: on the async engine when it is installed,
+    otherwise with a sync session in a worker thread."""
+    if async_driver_available():
+        async with async_session_scope() as s:
+            return await s.run_sync(fn, *args)
+    return await asyncio.to_thread(_in_session_scope, fn, *args)
+
+
+def _lost_dict(a):
+    data = {"id": a.id, "version": a.version, "owner_id": a.owner_id}
+    data.update({f: getattr(a, f) for f in LOST_FIELDS})
+    return data
+
+
+def _found_dict(r):
+    data = {"id": r.id, "version": r.version, "finder_id": r.finder_id}
+    data.update({f: getattr(r, f) for f in FOUND_FIELDS})
+    return data
+
+
+def _list_reports(s, days, species):
+    losts = s.query(LostAnimal).filter(open_only(LostAnimal))
+    founds = s.query(FoundReport).filter(open_only(FoundReport))
+    if days:
+        losts = losts.filter(reported_since(LostAnimal, days))
+        founds = founds.filter(reported_since(FoundReport, days))
+    if species:
+        losts = losts.filter(LostAnimal.species_norm == species)
+        founds = founds.filter(FoundReport.species_norm == species)
+    return ([dict(_lost_dict(a), owner=a.owner.username if a.owner else None)
+             for a in losts.order_by(LostAnimal.id.desc())],
+            [dict(_found_dict(r), finder=r.finder.username if r.finder else None)
+             for r in founds.order_by(FoundReport.id.desc())])
+
+
+async def list_reports(days=None, species=None):
+    """Open lost and found cases for the home feed, newest first: (losts, founds)."""
+    return await _run(_list_reports, days, species)
+
+
+def _my_posts(s, user_id):
+    return ([_lost_dict(a) for a in s.query(LostAnimal).filter_by(owner_id=user_id).order_by(LostAnimal.id.desc())],
+            [_found_dict(r) for r in s.query(FoundReport).filter_by(finder_id=user_id).order_by(FoundReport.id.desc())])
+
+
+async def my_posts(user_id):
+    """Every case posted by the user, whatever its status: (losts, founds)."""
+    return await _run(_my_posts, user_id)
+
+
+def _create(s, model, fields):
+    obj = model(**fields)
+    s.add(obj)
+    s.flush()
+    return obj.id
+
+
+async def create_lost(owner_id, **fields):
+    return await _run(_create, LostAnimal, dict(fields, owner_id=owner_id))
+
+
+async def create_found(finder_id, **fields):
+    return await _run(_create, FoundReport, dict(fields, finder_id=finder_id))
+
+
+def _update(s, model, owner, fields):
+    obj = s.query(model).filter_by(**owner).first()
+    if obj is None:
+        return False
+    for key, value in fields.items():
+        setattr(obj, key, value)
+    return True
+
+
+async def update_lost(lost_id, owner_id, **fields):
+    """Apply `fields` to the user's own lost report; False when it does not exist/belong to them."""
+    return await _run(_update, LostAnimal, {"id": lost_id, "owner_id": owner_id}, fields)
+
+
+async def update_found(found_id, finder_id, **fields):
+    return await _run(_update, FoundReport, {"id": found_id, "finder_id": finder_id}, fields)
+
+
+def _delete(s, model, report_id, owner_attr, user_id):
+    obj = s.get(model, int(report_id))
+    if obj is None or getattr(obj, owner_attr) != user_id:
+        return False
+    s.delete(obj)
+    return True
+
+
+async def delete_lost(lost_id, owner_id):
+    return await _run(_delete, LostAnimal, lost_id, "owner_id", owner_id)
+
+
+async def delete_found(found_id, finder_id):
+    return await _run(_delete, FoundReport, found_id, "finder_id", finder_id)
+
+
+def _find_user(s, username):
+    user = s.query(User).filter_by(username=username).first()
+    if user is not None:
+        s.expunge(user)   # keeps the password hash readable once the session has committed
+    return user
+
+
+async def authenticate(username, password):
+    """{"id", "username"} of the user when the password matches, else None.
+    bcrypt runs in a worker thread so it does not stall the event loop either."""
+    user = await _run(_find_user, username)
+    if user is None or not await asyncio.to_thread(user.check_password, password):
+        return None
+    return {"id": user.id, "username": user.username}
+
+
+async def _usage_check(username, password):
+    user = await authenticate(username, password)
+    assert user is not None, "wrong username or password"
+    losts, founds = await list_reports()
+    print(f"home feed: {len(losts)} lost, {len(founds)} found open cases")
+    lost_id = await create_lost(user["id"], name="async_repository check", species="gato")
+    assert await update_lost(lost_id, user["id"], desc_animal="edited")
+    mine = {a["id"]: a for a in (await my_posts(user["id"]))[0]}
+    assert mine[lost_id]["desc_animal"] == "edited" and mine[lost_id]["version"] == 2
+    assert await delete_lost(lost_id, user["id"])
+    assert lost_id not in {a["id"] for a in (await my_posts(user["id"]))[0]}
+    print("ok", "(async engine)" if async_driver_available() else "(sync fallback)")
+
+
+if __name__ == "__main__":
+    import sys
+    asyncio.run(_usage_check(*sys.argv[1:3]))
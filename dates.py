@@ -0,0 +1,77 @@
+# Parser for the free-text dates people type into the forms ("ontem", "12/03",
+# "3 de março de 2024", "2024-03-12", ...), used to fill the typed event_date columns.
+import re
+import unicodedata
+from datetime import date, timedelta
+
+MONTHS = {
+    "janeiro": 1, "jan": 1, "fevereiro": 2, "fev": 2, "marco": 3, "mar": 3,
+    "abril": 4, "abr": 4, "maio": 5, "mai": 5, "junho": 6, "jun": 6,
+    "julho": 7, "jul": 7, "agosto": 8, "ago": 8, "setembro": 9, "set": 9,
+    "outubro": 10, "out": 10, "novembro": 11, "nov": 11, "dezembro": 12, "dez": 12,
+}
+RELATIVE = {"hoje": 0, "ontem": 1, "anteontem": 2}
+
+_ISO = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})")
+_NUMERIC = re.compile(r"^(\d{1,2})[/.-](\d{1,2})(?:[/.-](\d{4}|\d{2}))?(?![\d/.-])")
+_WRITTEN = re.compile(r"^(\d{1,2})(?: de)? ([a-z]+)\.?(?:(?: de)? (\d{4}))?$")
+_DAYS_AGO = re.compile(r"^(?:ha|faz) (\d+) dias?(?: atras)?$")
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", text.strip().lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.replace(",", " ").split())
+
+
+def _make(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _without_year(month, day, today):
+    # "12/03" means the most recent 12/03, never a date in the future
+    d = _make(today.year, month, day)
+    if d and d > today:
+        d = _make(today.year - 1, month, day)
+    return d
+
+
+def is_relative(text):
+    """True for values like "ontem" or "há 3 dias", whose date depends on when they were typed."""
+    t = _normalize(text or "")
+    return t in RELATIVE or t == "semana passada" or bool(_DAYS_AGO.match(t))
+
+
+def parse_free_date(text, today=None):
+    """Best-effort date for a free-text value, or None when it cannot be understood."""
+    if not text:
+        return None
+    today = today or date.today()
+    t = _normalize(text)
+    if t in RELATIVE:
+        return today - timedelta(days=RELATIVE[t])
+    if t == "semana passada":
+        return today - timedelta(days=7)
+    m = _DAYS_AGO.match(t)
+    if m:
+        return today - timedelta(days=int(m.group(1)))
+    m = _ISO.match(t)
+    if m:
+        return _make(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    m = _NUMERIC.match(t)
+    if m:
+        day, month, year = int(m.group(1)), int(m.group(2)), m.group(3)
+        if year is None:
+            return _without_year(month, day, today)
+        year = int(year)
+        return _make(year + 2000 if year < 100 else year, month, day)
+    m = _WRITTEN.match(t)
+    if m and m.group(2) in MONTHS:
+        day, month = int(m.group(1)), MONTHS[m.group(2)]
+        if m.group(3):
+            return _make(int(m.group(3)), month, day)
+        return _without_year(month, day, today)
+    return None
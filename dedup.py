@@ -0,0 +1,174 @@
+# Near-duplicate detection for new lost/found reports.
+# Each report's text gets a MinHash signature over character shingles; signatures are
+# split into bands and kept in an LSH table, so a new report is only compared against
+# reports sharing at least one band instead of against the whole table. Candidates must
+# also be close in space and posted within MAX_DAYS_APART of each other.
+import calendar
+import hashlib
+import random
+import threading
+import time
+import unicodedata
+
+from models import LostAnimal, FoundReport, session_scope, add_report_listener, report_snapshot, open_only
+from geo import haversine_km
+
+SHINGLE_SIZE = 4
+MIN_SHINGLES = 8      # shorter texts ("gato", "gato preto") say too little to call two reports duplicates
+NUM_PERM = 64
+BANDS = 16            # 16 bands x 4 rows: pairs with ~50% similarity collide with high probability
+ROWS = NUM_PERM // BANDS
+SIMILARITY_THRESHOLD = 0.5
+MAX_DISTANCE_KM = 2.0
+MAX_DAYS_APART = 30
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1234)   # fixed seed: signatures must be stable within a process
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in text).split())
+
+
+def shingles(text):
+    text = _normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """Signature of the text, None when it has fewer than MIN_SHINGLES shingles."""
+    hashes = [int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big")
+              for sh in shingles(text)]
+    if len(hashes) < MIN_SHINGLES:
+        return None
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+
+def similarity(sig1, sig2):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(sig1, sig2)) / NUM_PERM
+
+
+def _timestamp(reported_at):
+    # reported_at is a naive UTC datetime
+    return calendar.timegm(reported_at.utctimetuple()) if reported_at else None
+
+
+def report_text(kind, fields):
+    """Text used for a report's signature; `fields` is a row snapshot or form values.
+    Empty when the report has no name/description, since the species alone matches every
+    other report of that species."""
+    if kind == "lost":
+        parts = (fields.get("name"), fields.get("species"), fields.get("desc_animal"))
+        identifying = parts[0], parts[2]
+    else:
+        parts = (fields.get("species"), fields.get("found_description"))
+        identifying = parts[1:]
+    if not any(p and p.strip() for p in identifying):
+        return ""
+    return " ".join(p for p in parts if p)
+
+
+class DuplicateIndex:
+    def __init__(self):
+        self._entries = {}   # (kind, id) -> (signature, lat, lon, ts)
+        self._bands = [dict() for _ in range(BANDS)]   # band -> {band values: set of (kind, id)}
+        self._lock = threading.Lock()
+
+    def _band_keys(self, sig):
+        return [sig[b * ROWS:(b + 1) * ROWS] for b in range(BANDS)]
+
+    def add(self, kind, report_id, text, lat, lon, ts=None):
+        sig = minhash(text)
+        with self._lock:
+            old = self._entries.get((kind, report_id))
+            if ts is None and old is not None:
+                ts = old[3]   # edits keep the original submit time
+            self._remove(kind, report_id)
+            if sig is None:
+                return
+            self._entries[(kind, report_id)] = (sig, lat, lon, ts)
+            for table, key in zip(self._bands, self._band_keys(sig)):
+                table.setdefault(key, set()).add((kind, report_id))
+
+    def remove(self, kind, report_id):
+        with self._lock:
+            self._remove(kind, report_id)
+
+    def _remove(self, kind, report_id):
+        entry = self._entries.pop((kind, report_id), None)
+        if entry is None:
+            return
+        for table, key in zip(self._bands, self._band_keys(entry[0])):
+            bucket = table.get(key)
+            if bucket:
+                bucket.discard((kind, report_id))
+                if not bucket:
+                    del table[key]
+
+    def find(self, kind, text, lat, lon, ts=None, exclude_id=None):
+        """[(similarity, report id)] of likely duplicates of the same kind, best first."""
+        sig = minhash(text)
+        if sig is None:
+            return []
+        with self._lock:
+            candidates = set()
+            for table, key in zip(self._bands, self._band_keys(sig)):
+                candidates |= table.get(key, set())
+            entries = [(rid, self._entries[(k, rid)]) for k, rid in candidates if k == kind and rid != exclude_id]
+        matches = []
+        for rid, (other_sig, o_lat, o_lon, o_ts) in entries:
+            if lat is not None and lon is not None and o_lat is not None and o_lon is not None:
+                if haversine_km(lat, lon, o_lat, o_lon) > MAX_DISTANCE_KM:
+                    continue
+            if ts is not None and o_ts is not None and abs(ts - o_ts) > MAX_DAYS_APART * 86400:
+                continue
+            sim = similarity(sig, other_sig)
+            if sim >= SIMILARITY_THRESHOLD:
+                matches.append((sim, rid))
+        matches.sort(reverse=True)
+        return matches
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index():
+    """The shared index, built from the database on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = DuplicateIndex()
+                with session_scope() as s:
+                    for a in s.query(LostAnimal).filter(open_only(LostAnimal)):
+                        index.add("lost", a.id, report_text("lost", report_snapshot(a)), a.latitude, a.longitude,
+                                  _timestamp(a.reported_at))
+                    for r in s.query(FoundReport).filter(open_only(FoundReport)):
+                        index.add("found", r.id, report_text("found", report_snapshot(r)), r.latitude, r.longitude,
+                                  _timestamp(r.reported_at))
+                _index = index
+    return _index
+
+
+def find_duplicates(kind, fields, lat, lon, exclude_id=None):
+    return get_duplicate_index().find(kind, report_text(kind, fields), lat, lon, ts=time.time(), exclude_id=exclude_id)
+
+
+def _on_report_change(kind, action, before, after):
+    if _index is None:
+        return   # not built yet; it will read the committed rows when it is
+    if after is None or after["status"] != "open":
+        _index.remove(kind, (after or before)["id"])
+    else:
+        _index.add(kind, after["id"], report_text(kind, after), after["latitude"], after["longitude"],
+                   _timestamp(after.get("reported_at")))
+
+
+add_report_listener(_on_report_change)
@@ -0,0 +1,65 @@
+# Open-case counts per (kind, canonical species) for the species filter chips on the home
+# screen and the map. Counted with one GROUP BY on first use, then kept current by the
+# report listener (+1/-1 per insert, update and delete) instead of being recounted.
+import threading
+
+from sqlalchemy import func
+
+from models import LostAnimal, FoundReport, session_scope, add_report_listener, open_only
+from species import SPECIES_LABELS
+
+KINDS = ("lost", "found")
+
+
+class SpeciesFacets:
+    def __init__(self):
+        self._counts = None   # (kind, species_norm) -> open cases; None until first use
+        self._lock = threading.Lock()
+
+    def _load(self):
+        counts = {}
+        with session_scope() as s:
+            for kind, model in (("lost", LostAnimal), ("found", FoundReport)):
+                rows = s.query(model.species_norm, func.count()).filter(open_only(model)).group_by(model.species_norm)
+                for species, n in rows:
+                    counts[(kind, species)] = n
+        return counts
+
+    def counts(self, kinds=KINDS):
+        """{species_norm: {"lost": n, "found": n}} for the given kinds, zero entries left out."""
+        with self._lock:
+            if self._counts is None:
+                self._counts = self._load()
+            items = list(self._counts.items())
+        result = {}
+        for (kind, species), n in items:
+            if kind in kinds and n:
+                result.setdefault(species, dict.fromkeys(kinds, 0))[kind] = n
+        return result
+
+    def chips(self, kinds=KINDS):
+        """(species_norm, label, total) for the filter chips, most common first; unknown species last."""
+        rows = [(species, SPECIES_LABELS.get(species, species), sum(by_kind.values()))
+                for species, by_kind in self.counts(kinds).items() if species]
+        rows.sort(key=lambda r: (r[0] == "outro", -r[2], r[1]))
+        return rows
+
+    def apply(self, kind, species, delta):
+        with self._lock:
+            if self._counts is None:
+                return   # not loaded yet; the first counts() call reads the committed rows
+            key = (kind, species)
+            self._counts[key] = max(0, self._counts.get(key, 0) + delta)
+
+
+species_facets = SpeciesFacets()
+
+
+def _on_report_change(kind, action, before, after):
+    # only open cases are counted, so closing/archiving a case also decrements its species
+    for snap, delta in ((before, -1), (after, 1)):
+        if snap and snap["status"] == "open":
+            species_facets.apply(kind, snap["species_norm"], delta)
+
+
+add_report_listener(_on_report_change)
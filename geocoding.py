@@ -0,0 +1,356 @@
+# Geocoding through an ordered chain of providers: a local Nominatim-compatible server,
+# an offline gazetteer file and the public Nominatim service, by default in that order.
+# Each provider has its own timeout and a circuit breaker, so a provider that keeps failing
+# is skipped for a while instead of making every lookup wait out its timeout.
+#
+#   SIARA_GEOCODERS=local,gazetteer,nominatim   provider order (unconfigured ones are left out)
+#   SIARA_GEOCODER_LOCAL_URL=http://host:port   local/self-hosted Nominatim-compatible server
+#   SIARA_GAZETTEER=gazetteer.csv               offline "name,lat,lon" file
+#   SIARA_GEOCODER_TIMEOUT_<NAME>=seconds       per-provider timeout (local 2, nominatim 5)
+#   SIARA_GEOCODER_BREAKER_FAILURES=3           consecutive failures that open a breaker
+#   SIARA_GEOCODER_BREAKER_RESET=60             seconds before an open breaker lets a retry through
+#   SIARA_REVERSE_REUSE_M=25                    reuse the reverse result of a cached point this close
+import abc
+import csv
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from address_index import normalize
+from geo import haversine_km
+from profiling import timed_phase
+
+USER_AGENT = "siara_app_geocoder"
+DEFAULT_ORDER = "local,gazetteer,nominatim"
+DEFAULT_TIMEOUTS = {"local": 2.0, "gazetteer": 0.0, "nominatim": 5.0}
+POOL_SIZE = 10   # keep-alive connections per provider, one per concurrent Flet session is plenty
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+class GeocodingUnavailable(Exception):
+    """No provider could answer (errors, timeouts, open breakers). Unlike a "not found"
+    answer this is transient, so callers must not cache it."""
+
+
+class CircuitBreaker:
+    """Opens after `max_failures` consecutive failures; once `reset_after` seconds have
+    passed a single trial call is let through (half-open) to decide whether to close again."""
+
+    def __init__(self, max_failures=3, reset_after=60.0):
+        self.max_failures = max_failures
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_after or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.max_failures:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+class Provider(abc.ABC):
+    """geocode() returns (lat, lon) and reverse() an address, or None when the provider has
+    no answer; both raise on errors/timeouts so the chain can tell the two apart."""
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(int(_env_float("SIARA_GEOCODER_BREAKER_FAILURES", 3)),
+                                      _env_float("SIARA_GEOCODER_BREAKER_RESET", 60))
+
+    @abc.abstractmethod
+    def geocode(self, text):
+        ...
+
+    @abc.abstractmethod
+    def reverse(self, lat, lon):
+        ...
+
+
+def _pooled_adapter(proxies, ssl_context):
+    # one keep-alive requests.Session per geolocator instead of a new connection per lookup
+    from geopy.adapters import RequestsAdapter, URLLibAdapter
+    try:
+        return RequestsAdapter(proxies=proxies, ssl_context=ssl_context,
+                               pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0)
+    except ImportError:   # requests is not installed
+        return URLLibAdapter(proxies=proxies, ssl_context=ssl_context)
+
+
+class NominatimProvider(Provider):
+    """Public Nominatim (min_delay=1 follows its usage policy) or a self-hosted server."""
+
+    def __init__(self, name, timeout, url=None, min_delay=0.0):
+        super().__init__(name, timeout)
+        self.url = url
+        self.min_delay = min_delay
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    with timed_phase(f"geopy init ({self.name})"):
+                        from geopy.geocoders import Nominatim
+                        from geopy.extra.rate_limiter import RateLimiter
+                        kwargs = {"user_agent": USER_AGENT, "timeout": self.timeout,
+                                  "adapter_factory": _pooled_adapter}
+                        if self.url:
+                            parts = urlsplit(self.url)
+                            kwargs.update(domain=parts.netloc + parts.path.rstrip("/"), scheme=parts.scheme or "http")
+                        geolocator = Nominatim(**kwargs)
+                        geocode, reverse = geolocator.geocode, geolocator.reverse
+                        if self.min_delay:
+                            # errors are raised (not turned into None) so the breaker sees them
+                            geocode = RateLimiter(geocode, min_delay_seconds=self.min_delay, max_retries=0, swallow_exceptions=False)
+                            reverse = RateLimiter(reverse, min_delay_seconds=self.min_delay, max_retries=0, swallow_exceptions=False)
+                        self._client = (geocode, reverse)
+        return self._client
+
+    def geocode(self, text):
+        from geopy.exc import GeocoderQueryError
+        geocode, _ = self._get_client()
+        try:
+            loc = geocode(text, timeout=self.timeout)
+        except GeocoderQueryError:
+            return None   # the server understood and rejected the query: a definite miss
+        return (loc.latitude, loc.longitude) if loc else None
+
+    def reverse(self, lat, lon):
+        from geopy.exc import GeocoderQueryError
+        _, reverse = self._get_client()
+        try:
+            loc = reverse(f"{lat}, {lon}", exactly_one=True, timeout=self.timeout)
+        except GeocoderQueryError:
+            return None
+        return loc.address if loc and getattr(loc, "address", None) else None
+
+
+class GazetteerProvider(Provider):
+    """Offline lookups in a CSV of place names and coordinates (name,lat,lon), e.g. the
+    neighbourhoods and landmarks of the city the app is deployed in."""
+
+    CELL_DEGREES = 0.05        # reverse-lookup grid cell, about 5 km
+    REVERSE_MAX_KM = 1.0       # farther than this the nearest place name is not an answer
+
+    def __init__(self, name, path):
+        super().__init__(name, 0.0)
+        self.path = Path(path)
+        self._places = None    # normalized name -> (name, lat, lon)
+        self._grid = None      # (row, col) -> [(name, lat, lon), ...]
+        self._load_lock = threading.Lock()
+
+    def _load(self):
+        if self._places is None:
+            with self._load_lock:
+                if self._places is None:
+                    places, grid = {}, {}
+                    with self.path.open(newline="", encoding="utf-8") as f:
+                        for row in csv.reader(f):
+                            try:
+                                name, lat, lon = row[0].strip(), float(row[1]), float(row[2])
+                            except (IndexError, ValueError):
+                                continue   # header or malformed line
+                            places[normalize(name)] = (name, lat, lon)
+                            grid.setdefault(self._cell(lat, lon), []).append((name, lat, lon))
+                    self._grid = grid
+                    self._places = places
+        return self._places, self._grid
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.CELL_DEGREES), math.floor(lon / self.CELL_DEGREES)
+
+    def geocode(self, text):
+        places, _ = self._load()
+        hit = places.get(normalize(text))
+        return (hit[1], hit[2]) if hit else None
+
+    def reverse(self, lat, lon):
+        _, grid = self._load()
+        row, col = self._cell(lat, lon)
+        best, best_km = None, self.REVERSE_MAX_KM
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                for name, plat, plon in grid.get((row + dr, col + dc), ()):
+                    d = haversine_km(lat, lon, plat, plon)
+                    if d <= best_km:
+                        best, best_km = name, d
+        return best
+
+
+class GeocoderChain:
+    """Tries the providers in order and returns the first answer. A provider with an open
+    breaker is skipped; if no provider answered and any of them failed or was skipped, the
+    result is GeocodingUnavailable instead of a cacheable miss."""
+
+    def __init__(self, providers):
+        self.providers = providers
+
+    def _run(self, op, *args):
+        unavailable = []
+        for provider in self.providers:
+            if not provider.breaker.allow():
+                unavailable.append(f"{provider.name}: circuit open")
+                continue
+            try:
+                result = getattr(provider, op)(*args)
+            except Exception as e:
+                provider.breaker.failure()
+                print(f"Geocoder {provider.name} {op} error:", e)
+                unavailable.append(f"{provider.name}: {e}")
+                continue
+            provider.breaker.success()
+            if result is not None:
+                return result
+        if unavailable:
+            raise GeocodingUnavailable("; ".join(unavailable))
+        return None
+
+    def geocode(self, text):
+        return self._run("geocode", text)
+
+    def reverse(self, lat, lon):
+        return self._run("reverse", lat, lon)
+
+
+def build_chain():
+    providers = []
+    for name in os.environ.get("SIARA_GEOCODERS", DEFAULT_ORDER).split(","):
+        name = name.strip().lower()
+        timeout = _env_float(f"SIARA_GEOCODER_TIMEOUT_{name.upper()}", DEFAULT_TIMEOUTS.get(name, 5.0))
+        if name == "local":
+            url = os.environ.get("SIARA_GEOCODER_LOCAL_URL", "").strip()
+            if url:
+                providers.append(NominatimProvider("local", timeout, url=url))
+        elif name == "gazetteer":
+            path = os.environ.get("SIARA_GAZETTEER", "gazetteer.csv")
+            if Path(path).is_file():
+                providers.append(GazetteerProvider("gazetteer", path))
+        elif name == "nominatim":
+            providers.append(NominatimProvider("nominatim", timeout, min_delay=1.0))
+        elif name:
+            print(f"Unknown geocoder '{name}' in SIARA_GEOCODERS, ignored")
+    return GeocoderChain(providers)
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution: the first caller runs fn and
+    the others wait for its result (or exception) instead of issuing their own request."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class NearbyCache:
+    """Reverse-geocode results by point. get() also answers for any cached point within
+    `radius_m`, so coordinates a few metres apart (map clicks, re-typed decimals) reuse one
+    lookup. Points are bucketed in a grid of `radius_m`-sized cells."""
+
+    METERS_PER_DEGREE = 111320.0
+
+    def __init__(self, radius_m=None):
+        self.radius_m = radius_m if radius_m is not None else _env_float("SIARA_REVERSE_REUSE_M", 25)
+        self._cell = max(self.radius_m, 1.0) / self.METERS_PER_DEGREE
+        self._grid = {}   # (row, col) -> {(lat, lon): value}
+        self._lock = threading.Lock()
+
+    def _cell_of(self, lat, lon):
+        return math.floor(lat / self._cell), math.floor(lon / self._cell)
+
+    def put(self, lat, lon, value):
+        with self._lock:
+            self._grid.setdefault(self._cell_of(lat, lon), {})[(lat, lon)] = value
+
+    def get(self, lat, lon):
+        """(True, value) for the nearest cached point within the radius, else (False, None)."""
+        row, col = self._cell_of(lat, lon)
+        # a cell is radius_m tall; it is narrower in metres away from the equator
+        cols = math.ceil(1 / max(math.cos(math.radians(lat)), 0.01))
+        best, best_m = (False, None), self.radius_m
+        with self._lock:
+            for r in (row - 1, row, row + 1):
+                for c in range(col - cols, col + cols + 1):
+                    for (plat, plon), value in self._grid.get((r, c), {}).items():
+                        d = haversine_km(lat, lon, plat, plon) * 1000
+                        if d <= best_m:
+                            best, best_m = (True, value), d
+        return best
+
+
+_chain = None
+_chain_lock = threading.Lock()
+
+
+def get_geocoder():
+    """The process-wide provider chain, built on first use."""
+    global _chain
+    if _chain is None:
+        with _chain_lock:
+            if _chain is None:
+                _chain = build_chain()
+    return _chain
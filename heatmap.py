@@ -0,0 +1,100 @@
+# Lost/found density grid behind /heatmap.json.
+# Points are binned with NumPy the first time a zoom level is requested; each cached
+# grid is then kept current by the report listener instead of being recomputed.
+import math
+import threading
+
+import numpy as np
+
+from models import LostAnimal, FoundReport, session_scope, add_report_listener, open_only
+
+CELLS_PER_TILE = 4   # grid cells across one web-map tile at the requested zoom
+MAX_ZOOM = 19
+KINDS = ("lost", "found")
+
+
+def cell_size(zoom):
+    """Cell edge in degrees for a zoom level."""
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def _cell_of(lat, lon, size):
+    return int(math.floor((lat + 90.0) / size)), int(math.floor((lon + 180.0) / size))
+
+
+class HeatmapCache:
+    def __init__(self):
+        self._points = None   # kind -> (lats, lons) float arrays, loaded on demand
+        self._grids = {}      # zoom -> {(row, col): [lost, found]}
+        self._lock = threading.Lock()
+
+    def _load_points(self):
+        points = {}
+        with session_scope() as s:
+            for kind, model in (("lost", LostAnimal), ("found", FoundReport)):
+                rows = s.query(model.latitude, model.longitude).filter(
+                    open_only(model), model.latitude.isnot(None), model.longitude.isnot(None)).all()
+                coords = np.array(rows, dtype=np.float64).reshape(-1, 2)
+                points[kind] = (coords[:, 0], coords[:, 1])
+        return points
+
+    def _build(self, zoom):
+        if self._points is None:
+            self._points = self._load_points()
+        size = cell_size(zoom)
+        ncols = int(math.ceil(360.0 / size)) + 1
+        grid = {}
+        for i, kind in enumerate(KINDS):
+            lats, lons = self._points[kind]
+            if not len(lats):
+                continue
+            rows = np.floor((lats + 90.0) / size).astype(np.int64)
+            cols = np.floor((lons + 180.0) / size).astype(np.int64)
+            keys, counts = np.unique(rows * ncols + cols, return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                cell = grid.setdefault(divmod(key, ncols), [0, 0])
+                cell[i] += count
+        return grid
+
+    def cells(self, zoom, bbox=None):
+        """Non-empty cells as dicts with the cell centre and lost/found counts.
+        bbox is (west, south, east, north) in degrees."""
+        zoom = max(0, min(MAX_ZOOM, int(zoom)))
+        size = cell_size(zoom)
+        with self._lock:
+            grid = self._grids.get(zoom)
+            if grid is None:
+                grid = self._grids[zoom] = self._build(zoom)
+            items = list(grid.items())
+        if bbox is not None:
+            west, south, east, north = bbox
+            r0, c0 = _cell_of(south, west, size)
+            r1, c1 = _cell_of(north, east, size)
+            items = [(rc, n) for rc, n in items if r0 <= rc[0] <= r1 and c0 <= rc[1] <= c1]
+        return [{"lat": (r + 0.5) * size - 90.0, "lon": (c + 0.5) * size - 180.0,
+                 "lost": n[0], "found": n[1]} for (r, c), n in items]
+
+    def apply(self, kind, lat, lon, delta):
+        """Add (delta=1) or remove (delta=-1) one report in every cached grid."""
+        i = KINDS.index(kind)
+        with self._lock:
+            self._points = None   # reload raw points for zoom levels not built yet
+            for zoom, grid in self._grids.items():
+                rc = _cell_of(lat, lon, cell_size(zoom))
+                cell = grid.setdefault(rc, [0, 0])
+                cell[i] = max(0, cell[i] + delta)
+                if not cell[0] and not cell[1]:
+                    del grid[rc]
+
+
+heatmap_cache = HeatmapCache()
+
+
+def _on_report_change(kind, action, before, after):
+    # only open cases are counted, so a status change adds/removes the point too
+    for snap, delta in ((before, -1), (after, 1)):
+        if snap and snap["status"] == "open" and snap["latitude"] is not None and snap["longitude"] is not None:
+            heatmap_cache.apply(kind, snap["latitude"], snap["longitude"], delta)
+
+
+add_report_listener(_on_report_change)
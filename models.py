@@ -1,13 +1,20 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Float
+from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Float, Index, Boolean, Date, DateTime, Table, event, inspect, text, or_, literal_column
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import relationship, sessionmaker, object_session, validates
+from sqlalchemy.orm import Session as OrmSession
 from contextlib import contextmanager
-# Use system bcrypt (install with pip install bcrypt)
-import bcrypt
+from datetime import datetime, timedelta
+import os
+import threading
+from dates import parse_free_date, is_relative
+from species import normalize_species
+# bcrypt (install with pip install bcrypt) is imported lazily in set_password/check_password
 
 CONN = 'sqlite:///siara.db'
 
-engine = create_engine(CONN, echo=True)
+# SQL echo is on by default, except in fast-start mode where logging every statement slows the kiosk
+_echo_default = "0" if os.environ.get("SIARA_FAST_START") == "1" else "1"
+engine = create_engine(CONN, echo=os.environ.get("SIARA_DB_ECHO", _echo_default) == "1")
 Session = sessionmaker(bind=engine)
 session = Session()
 Base = declarative_base()
@@ -15,6 +22,7 @@ Base = declarative_base()
 @contextmanager
 def session_scope():
     """Provide a transactional scope around a series of operations."""
+    init_db()
     SessionLocal = sessionmaker(bind=engine)
     s = SessionLocal()
     try:
@@ -48,22 +56,29 @@ class User(Base):
         return f"<User(id={self.id}, username='{self.username}')>"
 
     def set_password(self, password: str):
+        import bcrypt
         password_bytes = password.encode('utf-8')
         hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
         self._password_hash = hashed.decode('utf-8')
 
     def check_password(self, password: str) -> bool:
+        import bcrypt
         password_bytes = password.encode('utf-8')
         if not self._password_hash:
             return False
         hash_bytes = self._password_hash.encode('utf-8')
         return bcrypt.checkpw(password_bytes, hash_bytes)
 
+# case lifecycle; only "open" cases are shown by default, the others get archived
+REPORT_STATUSES = ("open", "reunited", "adopted", "closed")
+OPEN_STATUS_SQL = "status = 'open'"
+
 class LostAnimal(Base):
     __tablename__ = 'lost_animals'
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     species = Column(String)
+    species_norm = Column(String)   # species.normalize_species(species), set by the validator
     lost_location = Column(String)
     desc_animal = Column(String)
     contact = Column(String)
@@ -72,9 +87,33 @@ class LostAnimal(Base):
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
 
+    # SHA-256 of the photo stored by photos.store_photo
+    photo_hash = Column(String, nullable=True)
+
+    reported_at = Column(DateTime, default=datetime.utcnow, index=True)   # when the report was posted
+    event_date = Column(Date, index=True)                                 # when the animal was lost
+    status = Column(String, nullable=False, default="open", server_default="open")
+
+    # bumped by the ORM on every UPDATE (version_id_col); the UI reuses rendered list items while it is unchanged
+    version = Column(Integer, nullable=False, server_default="1")
+
     owner_id = Column(Integer, ForeignKey('users.id'), nullable=True)
     owner = relationship("User", back_populates="lost_animals")
 
+    # bounding-box prefilter for nearby searches; partial indexes cover the open cases
+    __table_args__ = (
+        Index("ix_lost_animals_lat_lon", "latitude", "longitude"),
+        Index("ix_lost_animals_open_id", "id", sqlite_where=text(OPEN_STATUS_SQL)),
+        Index("ix_lost_animals_open_lat_lon", "latitude", "longitude", sqlite_where=text(OPEN_STATUS_SQL)),
+        Index("ix_lost_animals_open_species", "species_norm", sqlite_where=text(OPEN_STATUS_SQL)),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+    @validates("species")
+    def _normalize_species(self, key, value):
+        self.species_norm = normalize_species(value)
+        return value
+
     def __repr__(self):
         return f"<LostAnimal(id={self.id}, name='{self.name}', owner_id={self.owner_id})>"
 
@@ -82,19 +121,229 @@ class FoundReport(Base):
     __tablename__ = 'found_reports'
     id = Column(Integer, primary_key=True)
     species = Column(String)
+    species_norm = Column(String)   # species.normalize_species(species), set by the validator
     found_description = Column(String)
     found_location = Column(String)
-    found_date = Column(String)
+    found_date = Column(String)   # as typed; parsed into event_date
 
     # new location fields
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
 
+    # SHA-256 of the photo stored by photos.store_photo
+    photo_hash = Column(String, nullable=True)
+
+    reported_at = Column(DateTime, default=datetime.utcnow, index=True)   # when the report was posted
+    event_date = Column(Date, index=True)                                 # when the animal was found
+    status = Column(String, nullable=False, default="open", server_default="open")
+
+    # bumped by the ORM on every UPDATE (version_id_col); the UI reuses rendered list items while it is unchanged
+    version = Column(Integer, nullable=False, server_default="1")
+
     finder_id = Column(Integer, ForeignKey('users.id'), nullable=True)
     finder = relationship("User", back_populates="found_reports")
 
+    # bounding-box prefilter for nearby searches; partial indexes cover the open cases
+    __table_args__ = (
+        Index("ix_found_reports_lat_lon", "latitude", "longitude"),
+        Index("ix_found_reports_open_id", "id", sqlite_where=text(OPEN_STATUS_SQL)),
+        Index("ix_found_reports_open_lat_lon", "latitude", "longitude", sqlite_where=text(OPEN_STATUS_SQL)),
+        Index("ix_found_reports_open_species", "species_norm", sqlite_where=text(OPEN_STATUS_SQL)),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+    @validates("species")
+    def _normalize_species(self, key, value):
+        self.species_norm = normalize_species(value)
+        return value
+
+    @validates("found_date")
+    def _parse_found_date(self, key, value):
+        # only a new value is parsed: re-parsing "ontem" on every save would move the date
+        if value != self.found_date:
+            self.event_date = parse_free_date(value)
+        return value
+
     def __repr__(self):
         return f"<FoundReport(id={self.id}, found_location='{self.found_location}', finder_id={self.finder_id})>"
 
-# Ensure tables exist / create new columns for newly created DBs
-Base.metadata.create_all(engine)
\ No newline at end of file
+def _archive_table(source):
+    # same columns as the live table (no constraints), plus when/why the case was archived.
+    # "id" is not the key here: SQLite may hand a deleted id to a new live row later.
+    columns = [Column("archive_id", Integer, primary_key=True)]
+    columns += [Column(c.name, c.type, index=c.primary_key) for c in source.columns]
+    columns += [Column("archived_at", DateTime, default=datetime.utcnow, index=True),
+                Column("archive_reason", String)]
+    return Table(f"{source.name}_archive", Base.metadata, *columns)
+
+lost_animals_archive = _archive_table(LostAnimal.__table__)
+found_reports_archive = _archive_table(FoundReport.__table__)
+
+class PhotoHash(Base):
+    __tablename__ = 'photo_hashes'
+    content_hash = Column(String, primary_key=True)   # photos.store_photo hash
+    dhash = Column(String, nullable=False)            # 64-bit perceptual difference hash, hex
+
+    def __repr__(self):
+        return f"<PhotoHash(content_hash='{self.content_hash[:12]}', dhash='{self.dhash}')>"
+
+class AreaSubscription(Base):
+    """An alert area: a circle (center + radius) or a polygon, optionally limited to a species/kind."""
+    __tablename__ = 'area_subscriptions'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    label = Column(String)
+    center_lat = Column(Float)
+    center_lon = Column(Float)
+    radius_km = Column(Float)
+    polygon = Column(String)       # JSON [[lat, lon], ...] for polygon areas
+    species = Column(String)       # only alert for this species (optional)
+    report_kind = Column(String)   # "lost", "found" or None for both
+
+    # bounding box of the area, indexed in memory by alerts.SubscriptionRTree
+    min_lat = Column(Float, nullable=False)
+    max_lat = Column(Float, nullable=False)
+    min_lon = Column(Float, nullable=False)
+    max_lon = Column(Float, nullable=False)
+
+    def __repr__(self):
+        return f"<AreaSubscription(id={self.id}, user_id={self.user_id}, label='{self.label}')>"
+
+class Notification(Base):
+    __tablename__ = 'notifications'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    subscription_id = Column(Integer, ForeignKey('area_subscriptions.id', ondelete="SET NULL"), nullable=True)
+    report_kind = Column(String)
+    report_id = Column(Integer)
+    message = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    read = Column(Boolean, nullable=False, default=False)
+
+    # unread badge on the home screen
+    __table_args__ = (Index("ix_notifications_user_read", "user_id", "read"),)
+
+    def __repr__(self):
+        return f"<Notification(id={self.id}, user_id={self.user_id}, read={self.read})>"
+
+def open_only(model):
+    """Filter for open cases. The literal (not a bound parameter) lets SQLite use the
+    partial indexes, whose WHERE clause must be implied by the query."""
+    return model.status == literal_column("'open'")
+
+def reported_since(model, days):
+    """Filter for reports posted, or lost/found, within the last `days` days."""
+    since = datetime.utcnow() - timedelta(days=days)
+    return or_(model.reported_at >= since, model.event_date >= since.date())
+
+# ---- Report change notifications ----
+# In-process caches/indexes built from the report tables (heatmap, ...) subscribe here
+# and are updated incrementally after each commit instead of being rebuilt.
+REPORT_KINDS = {LostAnimal: "lost", FoundReport: "found"}
+_report_listeners = []
+
+def add_report_listener(fn):
+    """Register fn(kind, action, before, after), called after a commit that inserted,
+    updated or deleted a LostAnimal ("lost") / FoundReport ("found"). before/after are
+    column dicts (before is None for inserts, after is None for deletes)."""
+    _report_listeners.append(fn)
+
+def report_snapshot(obj, old=False):
+    """Column values of a report as a dict; old=True gives the values before pending changes."""
+    state = inspect(obj)
+    snap = {}
+    for attr in state.mapper.column_attrs:
+        value = getattr(obj, attr.key)
+        if old:
+            deleted = state.attrs[attr.key].history.deleted
+            if deleted:
+                value = deleted[0]
+        snap[attr.key] = value
+    return snap
+
+def _queue_report_change(target, action, before, after):
+    s = object_session(target)
+    if s is not None:
+        s.info.setdefault("report_changes", []).append((REPORT_KINDS[type(target)], action, before, after))
+
+for _model in REPORT_KINDS:
+    event.listen(_model, "after_insert", lambda m, c, t: _queue_report_change(t, "insert", None, report_snapshot(t)))
+    event.listen(_model, "after_update", lambda m, c, t: _queue_report_change(t, "update", report_snapshot(t, old=True), report_snapshot(t)))
+    event.listen(_model, "after_delete", lambda m, c, t: _queue_report_change(t, "delete", report_snapshot(t, old=True), None))
+
+@event.listens_for(OrmSession, "after_commit")
+def _dispatch_report_changes(s):
+    for change in s.info.pop("report_changes", []):
+        for fn in list(_report_listeners):
+            try:
+                fn(*change)
+            except Exception as e:
+                print("Report listener error:", e)
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_report_changes(s):
+    s.info.pop("report_changes", None)
+
+_db_ready = False
+_db_lock = threading.Lock()
+
+def _add_missing_columns():
+    # create_all does not alter existing tables; add columns introduced after a DB was created
+    existing_tables = inspect(engine).get_table_names()
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in inspect(conn).get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    default = f"'{default}'" if isinstance(default, str) else default.text
+                    ddl += f" DEFAULT {default}"
+                conn.execute(text(ddl))
+
+def _backfill_event_dates(conn):
+    rows = conn.execute(text("SELECT id, found_date FROM found_reports WHERE found_date IS NOT NULL AND event_date IS NULL"))
+    for report_id, found_date in rows.fetchall():
+        # "ontem", "há 3 dias" meant the day they were typed, not today; leave those unknown
+        parsed = None if is_relative(found_date) else parse_free_date(found_date)
+        if parsed:
+            conn.execute(text("UPDATE found_reports SET event_date = :d WHERE id = :id"), {"d": parsed.isoformat(), "id": report_id})
+
+def _backfill_species_norm(conn):
+    for table in ("lost_animals", "found_reports"):
+        rows = conn.execute(text(f"SELECT id, species FROM {table} WHERE species IS NOT NULL AND species_norm IS NULL"))
+        for report_id, species in rows.fetchall():
+            conn.execute(text(f"UPDATE {table} SET species_norm = :n WHERE id = :id"),
+                         {"n": normalize_species(species), "id": report_id})
+
+# one-time data fixes, tracked with SQLite's user_version (index i brings the DB to version i+1)
+DATA_MIGRATIONS = [_backfill_event_dates, _backfill_species_norm]
+
+def _run_data_migrations():
+    with engine.begin() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+        for i in range(version, len(DATA_MIGRATIONS)):
+            DATA_MIGRATIONS[i](conn)
+            conn.execute(text(f"PRAGMA user_version = {i + 1}"))
+
+def init_db():
+    """Create missing tables on first use instead of at import time."""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_lock:
+        if _db_ready:
+            return
+        _add_missing_columns()
+        # Ensure tables exist / create new columns for newly created DBs
+        Base.metadata.create_all(engine)
+        # create_all skips tables that already exist, so add indexes introduced later
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        _run_data_migrations()
+        _db_ready = True
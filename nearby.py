@@ -0,0 +1,62 @@
+# "Nearby cases" queries: k-nearest / within-radius lost and found reports around a point.
+# Rows are prefiltered with a bounding box on the indexed latitude/longitude columns and
+# only the candidates inside the box get an exact haversine distance.
+from geo import MAX_RADIUS_KM, haversine_km, bounding_box
+from models import LostAnimal, FoundReport, open_only
+
+
+def _lost_row(a, distance):
+    return {"kind": "lost", "id": a.id, "title": a.name, "species": a.species,
+            "location": a.lost_location, "desc": a.desc_animal,
+            "lat": a.latitude, "lon": a.longitude, "distance_km": distance}
+
+
+def _found_row(r, distance):
+    return {"kind": "found", "id": r.id, "title": r.species or "Animal encontrado", "species": r.species,
+            "location": r.found_location, "desc": r.found_description,
+            "lat": r.latitude, "lon": r.longitude, "distance_km": distance}
+
+
+_SOURCES = {
+    "lost": (LostAnimal, _lost_row),
+    "found": (FoundReport, _found_row),
+}
+
+
+def within_radius(s, lat, lon, radius_km, kinds=("lost", "found")):
+    """All reports of `kinds` within `radius_km` of (lat, lon), nearest first, as plain dicts."""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    results = []
+    for kind in kinds:
+        model, to_row = _SOURCES[kind]
+        q = s.query(model).filter(open_only(model),
+                                  model.latitude.between(min_lat, max_lat),
+                                  model.longitude.isnot(None))
+        if min_lon is not None:
+            q = q.filter(model.longitude.between(min_lon, max_lon))
+        for obj in q:
+            d = haversine_km(lat, lon, obj.latitude, obj.longitude)
+            if d <= radius_km:
+                results.append(to_row(obj, d))
+    results.sort(key=lambda r: r["distance_km"])
+    return results
+
+
+def k_nearest(s, lat, lon, k, kinds=("lost", "found"), start_radius_km=2.0, max_radius_km=MAX_RADIUS_KM):
+    """The `k` reports nearest to (lat, lon). The search circle grows until it holds k
+    reports; anything outside the circle is farther than everything inside it."""
+    radius = start_radius_km
+    while True:
+        results = within_radius(s, lat, lon, radius, kinds)
+        if len(results) >= k or radius >= max_radius_km:
+            return results[:k]
+        radius = min(radius * 4, max_radius_km)
+
+
+def find_nearby(s, lat, lon, radius_km=None, k=None, kinds=("lost", "found")):
+    """Radius search, k-nearest search, or k-nearest within a radius when both are given."""
+    if k is None:
+        return within_radius(s, lat, lon, radius_km or 5.0, kinds)
+    if radius_km is None:
+        return k_nearest(s, lat, lon, k, kinds)
+    return k_nearest(s, lat, lon, k, kinds, start_radius_km=min(2.0, radius_km), max_radius_km=radius_km)
@@ -0,0 +1,177 @@
+# "Similar animals": a 64-bit difference hash (dHash) per stored photo, kept in a BK-tree
+# keyed by Hamming distance so lookups only visit the branches that can hold a match.
+# Hashes are computed by the photos worker pool when a photo is stored and persisted in
+# photo_hashes, so the tree can be rebuilt at startup without decoding any image; report
+# photos stored before that (or whose hash was never recorded) are hashed when it is built.
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from models import LostAnimal, FoundReport, PhotoHash, session_scope, open_only
+from geo import haversine_km
+from photos import add_photo_listener, original_path
+
+MAX_DISTANCE = 12   # of 64 bits; above this photos rarely show the same animal
+
+
+def dhash(img):
+    """Difference hash of a Pillow image: compares neighbouring pixels of a 9x8 grayscale copy."""
+    small = img.convert("L").resize((9, 8))
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    def __init__(self):
+        self._root = None   # [hash, {content_hash, ...}, {distance: child}]
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, key):
+        with self._lock:
+            if self._root is None:
+                self._root = [value, {key}, {}]
+                self._size += 1
+                return
+            node = self._root
+            while True:
+                d = hamming(value, node[0])
+                if d == 0:
+                    node[1].add(key)   # identical hash, e.g. the same picture re-encoded
+                    return
+                child = node[2].get(d)
+                if child is None:
+                    node[2][d] = [value, {key}, {}]
+                    self._size += 1
+                    return
+                node = child
+
+    def search(self, value, max_distance):
+        """[(distance, key)] for every stored hash within max_distance, nearest first."""
+        results = []
+        with self._lock:
+            stack = [self._root] if self._root is not None else []
+            while stack:
+                node = stack.pop()
+                d = hamming(value, node[0])
+                if d <= max_distance:
+                    results.extend((d, key) for key in node[1])
+                # triangle inequality: only children at distance d +/- max_distance can match
+                for child_d, child in node[2].items():
+                    if d - max_distance <= child_d <= d + max_distance:
+                        stack.append(child)
+        results.sort()
+        return results
+
+
+_tree = None
+_tree_lock = threading.Lock()
+
+
+def get_similarity_index():
+    """The shared BK-tree, loaded from photo_hashes on first use."""
+    global _tree
+    if _tree is None:
+        with _tree_lock:
+            if _tree is None:
+                tree = BKTree()
+                with session_scope() as s:
+                    for content_hash, value in s.query(PhotoHash.content_hash, PhotoHash.dhash):
+                        tree.add(int(value, 16), content_hash)
+                    unhashed = set()
+                    for model in (LostAnimal, FoundReport):
+                        unhashed.update(h for (h,) in s.query(model.photo_hash).filter(
+                            model.photo_hash.isnot(None), ~model.photo_hash.in_(s.query(PhotoHash.content_hash))))
+                for content_hash in unhashed:
+                    try:
+                        tree.add(_hash_original(content_hash), content_hash)
+                    except OSError as e:
+                        print("Photo hash error:", content_hash[:12], e)
+                _tree = tree
+    return _tree
+
+
+def _store_hash(content_hash, img):
+    value = dhash(img)
+    try:
+        with session_scope() as s:
+            if s.get(PhotoHash, content_hash) is None:
+                s.add(PhotoHash(content_hash=content_hash, dhash=f"{value:016x}"))
+    except IntegrityError:
+        pass   # another worker stored the same photo first; same content, same hash
+    return value
+
+
+def _hash_original(content_hash):
+    from PIL import Image, ImageOps
+    with Image.open(original_path(content_hash)) as img:
+        return _store_hash(content_hash, ImageOps.exif_transpose(img))
+
+
+def _record_hash(content_hash, img):
+    value = _store_hash(content_hash, img)
+    if _tree is not None:
+        _tree.add(value, content_hash)
+    return value
+
+
+def photo_dhash(content_hash):
+    """Stored hash of a photo, computing it now if the worker has not got to it yet."""
+    with session_scope() as s:
+        row = s.get(PhotoHash, content_hash)
+        if row is not None:
+            return int(row.dhash, 16)
+    value = _hash_original(content_hash)
+    if _tree is not None:
+        _tree.add(value, content_hash)
+    return value
+
+
+def similar_reports(content_hash, kinds=("lost",), near=None, radius_km=None, limit=10, max_distance=MAX_DISTANCE,
+                    exclude=None):
+    """Reports of `kinds` whose photo looks like `content_hash`, most similar first.
+    With `near=(lat, lon)` and `radius_km`, only reports within that radius are returned.
+    `exclude=(kind, id)` leaves out the querying report itself; other reports with the very
+    same photo (the same flyer posted by owner and finder) are kept as the best matches."""
+    matches = get_similarity_index().search(photo_dhash(content_hash), max_distance)
+    distance_of = {}
+    for d, key in matches:
+        distance_of.setdefault(key, d)
+    if not distance_of:
+        return []
+    results = []
+    with session_scope() as s:
+        for kind in kinds:
+            model = LostAnimal if kind == "lost" else FoundReport
+            for obj in s.query(model).filter(open_only(model), model.photo_hash.in_(list(distance_of))):
+                if exclude == (kind, obj.id):
+                    continue
+                km = None
+                if near is not None and obj.latitude is not None and obj.longitude is not None:
+                    km = haversine_km(near[0], near[1], obj.latitude, obj.longitude)
+                if radius_km is not None and (km is None or km > radius_km):
+                    continue
+                results.append({
+                    "kind": kind, "id": obj.id,
+                    "title": obj.name if kind == "lost" else (obj.species or "Animal encontrado"),
+                    "location": obj.lost_location if kind == "lost" else obj.found_location,
+                    "photo_hash": obj.photo_hash,
+                    "similarity": 1 - distance_of[obj.photo_hash] / 64,
+                    "distance_km": km,
+                })
+    results.sort(key=lambda r: (-r["similarity"], r["distance_km"] if r["distance_km"] is not None else float("inf")))
+    return results[:limit]
+
+
+add_photo_listener(_record_hash)
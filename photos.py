@@ -0,0 +1,125 @@
+# Report photos: originals are stored once per content (SHA-256) under photos/ next to
+# map_static/, and a small worker pool renders the thumbnail sizes off the UI thread.
+# Pillow (pip install pillow) is only needed for thumbnails; without it the original is served.
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+PHOTO_DIR = Path(os.getcwd()) / "photos"
+UPLOAD_DIR = PHOTO_DIR / "uploads"   # Flet web uploads land here before being stored
+THUMB_SIZES = {"sm": 96, "md": 320, "lg": 800}
+MAX_PHOTO_BYTES = 15 * 1024 * 1024
+
+_MAGIC = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbnails")
+_pending = {}   # (hash, size) -> Future, so a thumbnail is only rendered once
+_pending_lock = threading.RLock()   # RLock: done callbacks may run while it is held
+_photo_listeners = []
+
+
+def sniff_content_type(head):
+    for magic, content_type in _MAGIC:
+        if head.startswith(magic):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def is_photo_hash(value):
+    return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+def original_path(content_hash):
+    return PHOTO_DIR / "orig" / content_hash[:2] / content_hash
+
+
+def thumbnail_path(content_hash, size):
+    return PHOTO_DIR / "thumbs" / size / content_hash[:2] / f"{content_hash}.jpg"
+
+
+def store_photo(data):
+    """Store image bytes (deduplicated by content) and queue its thumbnails; returns the hash."""
+    if len(data) > MAX_PHOTO_BYTES:
+        raise ValueError("photo too large")
+    if sniff_content_type(data[:16]) is None:
+        raise ValueError("unsupported image format")
+    content_hash = hashlib.sha256(data).hexdigest()
+    path = original_path(content_hash)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{content_hash}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    for size in THUMB_SIZES:
+        _submit(content_hash, size)
+    return content_hash
+
+
+def add_photo_listener(fn):
+    """fn(content_hash, image) runs in the worker pool once per newly stored photo, with the
+    decoded Pillow image, so other indexes can reuse the decode done for the thumbnails."""
+    _photo_listeners.append(fn)
+
+
+def _render(content_hash, size):
+    out = thumbnail_path(content_hash, size)
+    if out.exists():
+        return out
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        print("Pillow not installed; serving original photos instead of thumbnails")
+        return original_path(content_hash)
+    with Image.open(original_path(content_hash)) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        if size == "sm":
+            for fn in _photo_listeners:
+                try:
+                    fn(content_hash, img)
+                except Exception as e:
+                    print("Photo listener error:", e)
+        px = THUMB_SIZES[size]
+        img.thumbnail((px, px))
+        out.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out.with_suffix(".tmp")
+        img.save(tmp, "JPEG", quality=85)
+        os.replace(tmp, out)
+    return out
+
+
+def _submit(content_hash, size):
+    key = (content_hash, size)
+    with _pending_lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _executor.submit(_render, content_hash, size)
+            _pending[key] = future
+            future.add_done_callback(lambda f: _forget(key))
+    return future
+
+
+def _forget(key):
+    with _pending_lock:
+        _pending.pop(key, None)
+
+
+def photo_file(content_hash, size=None, timeout=15):
+    """Path of the original or of a thumbnail (waiting for the worker if it is still
+    rendering); None if the photo is unknown."""
+    if not original_path(content_hash).exists():
+        return None
+    if size is None:
+        return original_path(content_hash)
+    out = thumbnail_path(content_hash, size)
+    if out.exists():
+        return out
+    return _submit(content_hash, size).result(timeout=timeout)
@@ -0,0 +1,179 @@
+# Opt-in timing/profiling for the Flet event handlers and screen builders in app.py.
+#
+# Everything is controlled through environment variables, and can be changed while
+# the app is running through an optional JSON control file:
+#
+#   SIARA_PROFILE=1                    enable timing of wrapped handlers
+#   SIARA_PROFILE_THRESHOLD_MS=100     only log calls slower than this (default 100)
+#   SIARA_PROFILE_DUMP=do_register_lost  run this handler under cProfile and dump stats; handlers
+#                                      are named by their enclosing functions too, and any trailing
+#                                      part of that name selects them ("show_edit_found.do_update")
+#   SIARA_PROFILE_DIR=profiles         where .prof dumps are written
+#   SIARA_PROFILE_CONTROL=profile.json control file, re-read whenever it changes, e.g.
+#                                      {"enabled": true, "threshold_ms": 50, "dump": "show_home"}
+#
+# Dumps can be inspected with `python -m pstats profiles/<file>.prof`.
+import cProfile
+import contextlib
+import functools
+import inspect
+import json
+import os
+import pstats
+import threading
+import time
+from pathlib import Path
+
+
+def _env_flag(name, default="0"):
+    return os.environ.get(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+_config = {
+    "enabled": _env_flag("SIARA_PROFILE"),
+    "threshold_ms": _env_float("SIARA_PROFILE_THRESHOLD_MS", 100),
+    "dump": os.environ.get("SIARA_PROFILE_DUMP", "").strip() or None,
+    "dir": os.environ.get("SIARA_PROFILE_DIR", "profiles"),
+}
+_control_file = os.environ.get("SIARA_PROFILE_CONTROL", "").strip() or None
+_control_mtime = None
+_lock = threading.Lock()
+
+
+def configure(enabled=None, threshold_ms=None, dump=None):
+    """Change profiling settings at runtime; `dump=""` clears the cProfile target."""
+    with _lock:
+        if enabled is not None:
+            _config["enabled"] = bool(enabled)
+        if threshold_ms is not None:
+            _config["threshold_ms"] = float(threshold_ms)
+        if dump is not None:
+            _config["dump"] = dump or None
+
+
+def _reload_control_file():
+    # cheap stat() per call; the file is only parsed again when its mtime changes
+    global _control_mtime
+    if not _control_file:
+        return
+    try:
+        mtime = os.stat(_control_file).st_mtime
+    except OSError:
+        return
+    if mtime == _control_mtime:
+        return
+    _control_mtime = mtime
+    try:
+        with open(_control_file, encoding="utf-8") as f:
+            data = json.load(f)
+        configure(enabled=data.get("enabled"),
+                  threshold_ms=data.get("threshold_ms"),
+                  dump=data.get("dump", ""))
+        print("[profile] settings reloaded from", _control_file, _config)
+    except Exception as e:
+        print("[profile] could not read control file:", e)
+
+
+def _dump_profile(name, prof):
+    out_dir = Path(_config["dir"])
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof"
+    prof.dump_stats(str(path))
+    print(f"[profile] cProfile dump for {name} written to {path}")
+    pstats.Stats(prof).sort_stats("cumulative").print_stats(10)
+
+
+def _handler_name(fn):
+    # closures in app.py share short names (do_search, do_update, ...), so use the qualified
+    # name without the "<locals>" parts: "main.show_edit_found.do_update"
+    return fn.__qualname__.replace(".<locals>", "")
+
+
+def _dump_wanted(name):
+    target = (_config["dump"] or "").replace(".<locals>", "")
+    return bool(target) and (name == target or name.endswith("." + target))
+
+
+def _wanted(name):
+    _reload_control_file()
+    return _config["enabled"] or _dump_wanted(name)
+
+
+@contextlib.contextmanager
+def _measure(name):
+    prof = None
+    if _dump_wanted(name):
+        prof = cProfile.Profile()
+        prof.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if prof is not None:
+            prof.disable()
+            _dump_profile(name, prof)
+        if elapsed_ms >= _config["threshold_ms"]:
+            print(f"[profile] {name} took {elapsed_ms:.1f} ms")
+
+
+def profiled(fn):
+    """Wrap a handler/screen builder so it is timed when profiling is enabled.
+    Async handlers stay coroutine functions (Flet awaits them); their time includes awaits."""
+    name = _handler_name(fn)
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            if not _wanted(name):
+                return await fn(*args, **kwargs)
+            with _measure(name):
+                return await fn(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _wanted(name):
+            return fn(*args, **kwargs)
+        with _measure(name):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+# ---- Startup timing (SIARA_STARTUP_REPORT=1) ----
+_PROCESS_START = time.perf_counter()
+_startup_phases = []
+
+
+class timed_phase:
+    """Context manager recording how long a startup phase (an import, an init) took."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _startup_phases.append((self.name, (time.perf_counter() - self.start) * 1000))
+        return False
+
+
+def startup_report(milestone):
+    """Print the recorded phases once `milestone` (e.g. the login screen) is reached."""
+    if not _env_flag("SIARA_STARTUP_REPORT"):
+        return
+    total_ms = (time.perf_counter() - _PROCESS_START) * 1000
+    print(f"[startup] {milestone} after {total_ms:.1f} ms")
+    for name, ms in sorted(_startup_phases, key=lambda p: p[1], reverse=True):
+        print(f"[startup]   {ms:8.1f} ms  {name}")
@@ -0,0 +1,54 @@
+# Canonical species vocabulary. The free-text "Espécie" typed in the forms ("Cachorro",
+# "cão", "vira-lata", "gata", ...) is mapped to one key stored in the indexed species_norm
+# columns, so filtering by species is an index lookup instead of a scan over free text.
+import unicodedata
+
+# canonical key -> label shown in the UI
+SPECIES_LABELS = {
+    "cachorro": "Cachorro",
+    "gato": "Gato",
+    "ave": "Ave",
+    "coelho": "Coelho",
+    "roedor": "Roedor",
+    "reptil": "Réptil",
+    "cavalo": "Cavalo",
+    "outro": "Outro",
+}
+
+# canonical key -> words (already accent-free, lower case) that mean it
+_SYNONYMS = {
+    "cachorro": ("cachorro", "cachorra", "cachorrinho", "cachorrinha", "cao", "caes", "cadela", "cadelinha",
+                 "canino", "vira-lata", "viralata", "filhote de cachorro", "dog", "perro"),
+    "gato": ("gato", "gata", "gatinho", "gatinha", "felino", "felina", "bichano", "cat"),
+    "ave": ("ave", "passaro", "passarinho", "calopsita", "periquito", "papagaio", "canario", "arara",
+            "pombo", "galinha", "pato", "bird"),
+    "coelho": ("coelho", "coelha", "coelhinho", "rabbit"),
+    "roedor": ("roedor", "hamster", "porquinho-da-india", "porquinho da india", "rato", "chinchila", "gerbil"),
+    "reptil": ("reptil", "tartaruga", "jabuti", "cagado", "iguana", "lagarto", "cobra", "serpente"),
+    "cavalo": ("cavalo", "egua", "potro", "ponei", "burro", "jumento", "mula"),
+}
+
+_LOOKUP = {word: key for key, words in _SYNONYMS.items() for word in words}
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", text.strip().lower())
+    return " ".join("".join(ch for ch in text if not unicodedata.combining(ch)).split())
+
+
+def normalize_species(text):
+    """Canonical key for a typed species, "outro" when unknown, None when left blank."""
+    if not text or not text.strip():
+        return None
+    folded = _fold(text)
+    if folded in _LOOKUP:
+        return _LOOKUP[folded]
+    # "cachorro preto", "gata siamesa": the first word that names a species wins
+    for word in folded.replace(",", " ").split():
+        if word in _LOOKUP:
+            return _LOOKUP[word]
+    return "outro"
+
+
+def species_label(key):
+    return SPECIES_LABELS.get(key, "Não informada")